@@ -0,0 +1,49 @@
+from datetime import datetime
+from uuid import UUID
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .hub import hub
+from .etag import bump_versions
+from .database import note_write
+from .leaderboard import leaderboards
+from .invalidation import bus
+from . import models
+
+# Friend ids per "pomodoros_today" notification, to stay under the NOTIFY limit
+EVENT_FANOUT_CHUNK = 100
+
+async def get_friend_ids(db: AsyncSession, user_id) -> list:
+    result = await db.execute(select(models.Friendship.friend_id).filter(
+        models.Friendship.user_id == user_id
+    ))
+    return result.scalars().all()
+
+async def on_sessions_logged(db: AsyncSession, user_id, sessions, xid: int):
+    """Post-commit side effects of logging sessions for `user_id` in transaction `xid`"""
+    bump_versions(user_id)
+    note_write(user_id)
+    leaderboards.record(user_id, sessions, xid)
+    
+    # Only sessions started today move the friends' "pomodoros today" count
+    today = datetime.utcnow().date()
+    delta = sum(1 for s in sessions if s.started_at.date() == today)
+    if not delta:
+        return
+    
+    friend_ids = await get_friend_ids(db, user_id)
+    # Friends keep reading from replicas; check_etag holds back their new
+    # ETag until the replicas have had time to catch up
+    bump_versions(*friend_ids)
+    for i in range(0, len(friend_ids), EVENT_FANOUT_CHUNK):
+        bus.publish("h", user_id, delta, *friend_ids[i:i + EVENT_FANOUT_CHUNK], fixed=2)
+
+@bus.handler("h")
+def _publish_pomodoros_today(user_id: str, delta: str, *friend_ids: str):
+    """Push a friend's new sessions to the clients connected to this worker"""
+    hub.publish([UUID(friend_id) for friend_id in friend_ids], {
+        "type": "pomodoros_today",
+        "friend_id": str(UUID(user_id)),
+        "delta": int(delta)
+    })
+
+bus.on_flush(hub.resync_all)
@@ -1,64 +1,156 @@
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
 from .config import settings
-from .database import get_db
+from .database import get_db, get_read_engine, get_replica_router, get_engine, AsyncSessionLocal
+from .cache import TTLCache
+from .metrics import time_google
+from .http import get_http_client
+from .invalidation import bus
 from . import models
-import httpx
+from uuid import UUID
+import hashlib
+import time
 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 30
+STREAM_TOKEN_EXPIRE_SECONDS = 60
 
 security = HTTPBearer()
 
+# Decoded tokens (token -> user id) and loaded users (user id -> User)
+token_cache = TTLCache(lambda: settings.auth_cache_size, lambda: settings.auth_cache_ttl)
+user_cache = TTLCache(lambda: settings.auth_cache_size, lambda: settings.auth_cache_ttl)
+# Verified Google userinfo, keyed by a hash of the Google access token
+google_userinfo_cache = TTLCache(lambda: settings.auth_cache_size, lambda: settings.google_userinfo_cache_ttl)
+
+def invalidate_user(user_id):
+    """Drop a cached user, on every worker, so the next request reloads it"""
+    bus.publish("u", user_id)
+
+@bus.handler("u")
+def _evict_user(user_id: str):
+    user_cache.pop(str(UUID(user_id)))
+
+bus.on_flush(user_cache.clear)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, settings.secret_key, algorithm=ALGORITHM)
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> models.User:
-    token = credentials.credentials
-    credentials_exception = HTTPException(
+def create_stream_token(user_id) -> str:
+    """Short-lived token for EventSource, which cannot send an Authorization header.
+    
+    It travels in the query string, so it only opens the activity stream and
+    expires before it is worth anything in a log.
+    """
+    expire = datetime.utcnow() + timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+    return jwt.encode({"sub": str(user_id), "scope": "stream", "exp": expire}, settings.secret_key, algorithm=ALGORITHM)
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+def _decode(token: str, scope: str | None) -> dict:
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+        raise _credentials_exception()
+    if payload.get("sub") is None or payload.get("scope") != scope:
+        raise _credentials_exception()
+    return payload
+
+async def _load_user(db: AsyncSession, user_id: str) -> models.User:
+    user = user_cache.get(user_id)
     if user is None:
-        raise credentials_exception
+        result = await db.execute(select(models.User).filter(models.User.id == user_id))
+        user = result.scalars().first()
+        if user is None:
+            raise _credentials_exception()
+        # The cached instance is shared by concurrent requests; detach it so a
+        # rollback in this request's session cannot expire it under them
+        db.expunge(user)
+        user_cache.set(user_id, user)
+        # End the read so the connection goes back to the pool: read-only
+        # endpoints take theirs from get_read_db, possibly on a replica
+        await db.commit()
     return user
 
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> models.User:
+    token = credentials.credentials
+    
+    user_id = token_cache.get(token)
+    if user_id is None:
+        payload = _decode(token, scope=None)
+        user_id = payload["sub"]
+        # Never cache a token past its own expiry
+        expires_in = payload["exp"] - time.time() if "exp" in payload else None
+        token_cache.set(token, user_id, ttl=expires_in)
+    
+    return await _load_user(db, user_id)
+
+async def get_stream_user(
+    token: str = Query(..., description="Token from POST /friends/stream/token"),
+    db: AsyncSession = Depends(get_db)
+) -> models.User:
+    """Authenticate a stream request by its short-lived query-string token"""
+    return await _load_user(db, _decode(token, scope="stream")["sub"])
+
+async def get_read_db(
+    current_user: models.User = Depends(get_current_user),
+    primary_db: AsyncSession = Depends(get_db)
+):
+    """Session for read-only endpoints: a replica unless this user just wrote"""
+    engine = get_read_engine(current_user.id)
+    if engine is get_engine():
+        # The request's own session; a second one would hold a second primary connection
+        yield primary_db
+        return
+    async with AsyncSessionLocal(bind=engine) as db:
+        try:
+            yield db
+        except DBAPIError as exc:
+            replicas = get_replica_router()
+            if exc.connection_invalidated and replicas is not None:
+                replicas.mark_down(engine)
+            raise
+
 async def verify_google_token(token: str):
     """Verify Google OAuth token and return user info"""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            "https://www.googleapis.com/oauth2/v3/userinfo",
+    key = hashlib.sha256(token.encode()).hexdigest()
+    google_user = google_userinfo_cache.get(key)
+    if google_user is not None:
+        return google_user
+    
+    with time_google("userinfo"):
+        response = await get_http_client().get(
+            settings.google_userinfo_url,
             headers={"Authorization": f"Bearer {token}"}
         )
-        if response.status_code != 200:
-            raise HTTPException(status_code=401, detail="Invalid Google token")
-        return response.json()
+    if response.status_code != 200:
+        raise HTTPException(status_code=401, detail="Invalid Google token")
+    google_user = response.json()
+    google_userinfo_cache.set(key, google_user)
+    return google_user
 
-def get_or_create_user(db: Session, google_user: dict) -> models.User:
+async def get_or_create_user(db: AsyncSession, google_user: dict) -> models.User:
     """Get existing user or create new one from Google profile"""
-    user = db.query(models.User).filter(
+    result = await db.execute(select(models.User).filter(
         models.User.google_id == google_user["sub"]
-    ).first()
+    ))
+    user = result.scalars().first()
     
     if not user:
         user = models.User(
@@ -68,7 +160,15 @@ def get_or_create_user(db: Session, google_user: dict) -> models.User:
             picture=google_user.get("picture")
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
     
+    invalidate_user(user.id)
     return user
+
+async def get_admin_user(current_user: models.User = Depends(get_current_user)) -> models.User:
+    """Restrict an endpoint to the emails listed in ADMIN_EMAILS"""
+    admins = {email.strip().lower() for email in settings.admin_emails.split(",") if email.strip()}
+    if current_user.email.lower() not in admins:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
@@ -0,0 +1,64 @@
+from collections import OrderedDict
+import time
+
+_MISSING = object()
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after `ttl` seconds.
+    
+    `maxsize` and `ttl` may be zero-argument callables, read on use, so
+    module-level caches can be sized from settings without loading them
+    at import time.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+
+    @property
+    def maxsize(self) -> int:
+        return self._maxsize() if callable(self._maxsize) else self._maxsize
+
+    @property
+    def ttl(self) -> float:
+        return self._ttl() if callable(self._ttl) else self._ttl
+
+    def get(self, key, default=None):
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        maxsize = self.maxsize
+        while len(self._data) > maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
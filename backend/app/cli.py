@@ -0,0 +1,78 @@
+"""Maintenance commands, run from the backend directory:
+
+    python -m app.cli migrate
+    python -m app.cli backfill-stats [--user USER_ID] [--since YYYY-MM-DD]
+    python -m app.cli partitions [--ahead 3] [--keep-months N [--archive-dir DIR]]
+    python -m app.cli prune-idempotency
+"""
+import argparse
+from datetime import date, datetime, timedelta
+from sqlalchemy import delete
+from .config import settings
+from .database import Base, SessionLocal, get_sync_engine
+from .stats import rebuild_daily_stats
+from . import partitions
+from . import models  # noqa: F401  (registers tables on Base.metadata)
+
+def migrate(args):
+    engine = get_sync_engine()
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        if partitions.is_partitioned(connection):
+            partitions.ensure_partitions(connection)
+    print("Schema is up to date")
+
+def manage_partitions(args):
+    with get_sync_engine().connect() as connection:
+        if not partitions.is_partitioned(connection):
+            raise SystemExit("sessions is not partitioned; apply migrations/sessions_partitioning.sql first")
+        for name in partitions.ensure_partitions(connection, months_ahead=args.ahead):
+            print(f"Created {name}")
+        connection.commit()
+        if args.keep_months is not None:
+            archived = partitions.archive_partitions(connection, args.keep_months, args.archive_dir)
+            for name in archived:
+                print(f"Archived {name} to {args.archive_dir}" if args.archive_dir else f"Detached {name}")
+
+def backfill_stats(args):
+    db = SessionLocal(bind=get_sync_engine())
+    try:
+        since = args.since or partitions.retained_since(db.connection())
+        rows = rebuild_daily_stats(db, user_id=args.user, since=since)
+    finally:
+        db.close()
+    print(f"Rebuilt {rows} daily_user_stats rows" + (f" from {since}" if since else ""))
+
+def prune_idempotency(args):
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.idempotency_ttl)
+    with get_sync_engine().begin() as connection:
+        result = connection.execute(delete(models.IdempotencyKey).where(models.IdempotencyKey.created_at < cutoff))
+    print(f"Deleted {result.rowcount} expired idempotency keys")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    migrate_parser = commands.add_parser("migrate", help="Create missing tables and indexes")
+    migrate_parser.set_defaults(func=migrate)
+    
+    backfill = commands.add_parser("backfill-stats", help="Rebuild daily_user_stats from sessions")
+    backfill.add_argument("--user", help="Only rebuild this user id")
+    backfill.add_argument("--since", type=date.fromisoformat,
+                          help="Only rebuild days from this date (default: the oldest attached partition)")
+    backfill.set_defaults(func=backfill_stats)
+    
+    partitions_parser = commands.add_parser("partitions", help="Create future sessions partitions, archive old ones")
+    partitions_parser.add_argument("--ahead", type=int, default=3, help="Months of future partitions to keep ready")
+    partitions_parser.add_argument("--keep-months", type=int, help="Detach partitions older than this many months")
+    partitions_parser.add_argument("--archive-dir", help="Dump detached partitions here as .csv.gz and drop them")
+    partitions_parser.set_defaults(func=manage_partitions)
+    
+    prune = commands.add_parser("prune-idempotency", help="Delete expired rows from idempotency_keys")
+    prune.set_defaults(func=prune_idempotency)
+    
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -7,8 +8,52 @@ class Settings(BaseSettings):
     google_client_secret: str
     google_redirect_uri: str
     frontend_url: str = "http://localhost:3000"
+    google_token_url: str = "https://oauth2.googleapis.com/token"
+    google_userinfo_url: str = "https://www.googleapis.com/oauth2/v3/userinfo"
+    google_userinfo_cache_ttl: int = 300
+    auth_cache_size: int = 10000
+    auth_cache_ttl: int = 60
+    # Connections to open during startup so the first requests skip the handshake
+    db_pool_prewarm: int = 0
+    # Comma-separated read replica URLs; read-only endpoints round-robin over them
+    database_replica_urls: str = ""
+    replica_health_interval: int = 10
+    # After a write, that user's reads go to the primary for this many seconds
+    read_your_writes_seconds: int = 5
+    # Group-commit POST /sessions/ writes; "wait" answers 201 after the flush,
+    # "accept" answers 202 as soon as the session is queued
+    session_write_buffer: bool = False
+    session_write_durability: str = "wait"
+    session_flush_interval_ms: int = 10
+    session_flush_max_rows: int = 500
+    session_buffer_max_pending: int = 10000
+    # Idempotency-Key replay store: "memory" (per worker) or "postgres" (shared)
+    idempotency_store: str = "memory"
+    idempotency_ttl: int = 86400
+    idempotency_cache_size: int = 10000
+    # LISTEN/NOTIFY channel that keeps per-worker caches in step
+    invalidation_bus: bool = True
+    invalidation_channel: str = "pomo_invalidate"
+    # Leaderboards are also rebuilt from daily_user_stats at midnight UTC
+    leaderboard_rebuild_interval: int = 300
+    # Comma-separated emails allowed to use /admin endpoints
+    admin_emails: str = ""
+    # Slow-query log: off when slow_query_ms is 0
+    slow_query_ms: int = 0
+    slow_query_log_size: int = 200
+    slow_query_explain_rate: float = 0.0
     
     class Config:
         env_file = ".env"
 
-settings = Settings()
+@lru_cache
+def get_settings() -> Settings:
+    return Settings()
+
+class _LazySettings:
+    """Reads the environment on first attribute access, not at import"""
+
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
+settings = _LazySettings()
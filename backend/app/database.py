@@ -1,15 +1,156 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
+from .cache import TTLCache
+from .metrics import TimedQueuePool
+from .invalidation import bus
+from uuid import UUID
+import asyncio
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+def async_database_url(url: str) -> str:
+    """Point a postgresql:// URL at the asyncpg driver"""
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+# Engines are created on first use so importing the app needs no database.
+# Sessionmakers are unbound: AsyncSessionLocal(bind=get_engine()).
+_engine: AsyncEngine | None = None
+_sync_engine: Engine | None = None
+_engine_hooks = []
+
+AsyncSessionLocal = async_sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
-engine = create_engine(settings.database_url)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+def on_engine_created(hook):
+    """Run `hook(engine)` for every async engine, including ones already created"""
+    _engine_hooks.append(hook)
+    if _engine is not None:
+        hook(_engine)
+
+def create_api_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(async_database_url(url), pool_pre_ping=True, poolclass=TimedQueuePool)
+    for hook in _engine_hooks:
+        hook(engine)
+    return engine
+
+def get_engine() -> AsyncEngine:
+    """Async engine used by the API routers"""
+    global _engine
+    if _engine is None:
+        _engine = create_api_engine(settings.database_url)
+    return _engine
+
+def get_sync_engine() -> Engine:
+    """Sync engine for schema management and maintenance commands"""
+    global _sync_engine
+    if _sync_engine is None:
+        _sync_engine = create_engine(settings.database_url)
+    return _sync_engine
+
+class ReplicaRouter:
+    """Round-robin over healthy read replicas, checked in the background"""
+
+    def __init__(self, urls: list[str]):
+        self.engines = [create_api_engine(url) for url in urls]
+        self.healthy = {engine: True for engine in self.engines}
+        self._next = itertools.count()
+
+    def pick(self) -> AsyncEngine | None:
+        healthy = [engine for engine in self.engines if self.healthy[engine]]
+        if not healthy:
+            return None
+        return healthy[next(self._next) % len(healthy)]
+
+    def mark_down(self, engine: AsyncEngine):
+        if self.healthy.get(engine):
+            logger.warning("Replica %s marked down", engine.url.host)
+        self.healthy[engine] = False
+
+    async def check(self, engine: AsyncEngine, timeout: float = 2.0):
+        try:
+            async with engine.connect() as connection:
+                await asyncio.wait_for(connection.execute(text("SELECT 1")), timeout)
+        except Exception:
+            self.mark_down(engine)
+        else:
+            if not self.healthy[engine]:
+                logger.info("Replica %s is back up", engine.url.host)
+            self.healthy[engine] = True
+
+    async def run_health_checks(self, interval: float):
+        while True:
+            await asyncio.gather(*(self.check(engine) for engine in self.engines))
+            await asyncio.sleep(interval)
+
+    async def dispose(self):
+        for engine in self.engines:
+            await engine.dispose()
+
+_replicas: ReplicaRouter | None = None
+
+def get_replica_router() -> ReplicaRouter | None:
+    """None when no DATABASE_REPLICA_URLS are configured"""
+    global _replicas
+    if _replicas is None:
+        urls = [url.strip() for url in settings.database_replica_urls.split(",") if url.strip()]
+        if urls:
+            _replicas = ReplicaRouter(urls)
+    return _replicas
+
+# Users who wrote recently read from the primary until replicas catch up
+_recent_writers = TTLCache(100_000, lambda: settings.read_your_writes_seconds)
+# After missed invalidations nobody's recent writes are known: everyone reads the primary
+_primary_until = 0.0
+
+def note_write(*user_ids):
+    """Route these users' reads to the primary, on every worker"""
+    bus.publish("w", *user_ids)
+
+@bus.handler("w")
+def _remember_writers(*user_ids: str):
+    for user_id in user_ids:
+        _recent_writers.set(str(UUID(user_id)), True)
+
+@bus.on_flush
+def _forget_writers():
+    global _primary_until
+    _primary_until = time.monotonic() + settings.read_your_writes_seconds
+
+def reads_from_primary(user_id=None) -> bool:
+    """Whether this user's read-only work must go to the primary"""
+    if get_replica_router() is None or time.monotonic() < _primary_until:
+        return True
+    return user_id is not None and bool(_recent_writers.get(str(user_id)))
+
+def get_read_engine(user_id=None) -> AsyncEngine:
+    """A healthy replica for read-only work, or the primary when that is not safe"""
+    if reads_from_primary(user_id):
+        return get_engine()
+    return get_replica_router().pick() or get_engine()
+
+async def prewarm_pool(connections: int):
+    """Open pool connections up front so early requests skip connect + auth"""
+    engine = get_engine()
+    opened = await asyncio.gather(*(engine.connect() for _ in range(connections)))
+    for connection in opened:
+        await connection.close()
+
+async def dispose_engines():
+    """Close pooled connections on shutdown"""
+    if _engine is not None:
+        await _engine.dispose()
+    if _replicas is not None:
+        await _replicas.dispose()
+
+async def get_db():
+    async with AsyncSessionLocal(bind=get_engine()) as db:
         yield db
-    finally:
-        db.close()
@@ -0,0 +1,92 @@
+from collections import defaultdict
+from datetime import datetime
+from fastapi import Depends, Request, Response
+from . import models
+from .auth import get_current_user
+from .config import settings
+from .database import reads_from_primary
+from .invalidation import bus
+from uuid import UUID
+import hashlib
+import time
+import uuid
+
+class DataVersions:
+    """Per-user data version counters, bumped whenever a user's view changes.
+    
+    Counters live in process memory, so every ETag carries the process epoch:
+    a restart (or another worker) can never produce a false match.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self._versions: dict = defaultdict(int)
+        self._bumped_at: dict = {}
+
+    def get(self, user_id) -> int:
+        return self._versions.get(str(user_id), 0)
+
+    def bump(self, *user_ids):
+        now = time.monotonic()
+        for user_id in user_ids:
+            self._versions[str(user_id)] += 1
+            self._bumped_at[str(user_id)] = now
+
+    def bumped_within(self, user_id, seconds: float) -> bool:
+        bumped_at = self._bumped_at.get(str(user_id))
+        return bumped_at is not None and time.monotonic() - bumped_at < seconds
+
+    def reset(self):
+        """Invalidate every ETag this process has handed out"""
+        self.epoch = uuid.uuid4().hex[:8]
+        self._versions.clear()
+        self._bumped_at.clear()
+
+versions = DataVersions()
+
+def bump_versions(*user_ids):
+    """Bump data versions here and on every other worker"""
+    bus.publish("v", *user_ids)
+
+@bus.handler("v")
+def _bump_versions(*user_ids: str):
+    versions.bump(*map(UUID, user_ids))
+
+bus.on_flush(versions.reset)
+
+class NotModified(Exception):
+    def __init__(self, etag: str):
+        self.etag = etag
+
+def not_modified_handler(request: Request, exc: NotModified) -> Response:
+    return Response(status_code=304, headers={"ETag": exc.etag})
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+async def check_etag(
+    request: Request,
+    response: Response,
+    current_user: models.User = Depends(get_current_user)
+):
+    """Answer If-None-Match with 304 before the endpoint touches the database.
+    
+    The ETag covers the user's data version, the exact URL and the UTC date,
+    since "today" endpoints change at midnight without any write.
+    """
+    today = datetime.utcnow().date()
+    digest = hashlib.blake2b(
+        f"{request.url.path}?{request.url.query}|{today}".encode(), digest_size=8
+    ).hexdigest()
+    etag = f'"{versions.epoch}-{versions.get(current_user.id)}-{digest}"'
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        raise NotModified(etag)
+    # Right after a bump a replica may not have the change yet; a body read
+    # there must not be cached under the new version
+    recently_bumped = versions.bumped_within(current_user.id, settings.read_your_writes_seconds)
+    if recently_bumped and not reads_from_primary(current_user.id):
+        return
+    response.headers["ETag"] = etag
@@ -0,0 +1,124 @@
+import asyncio
+import heapq
+from collections import Counter
+from uuid import UUID
+from sqlalchemy import select
+from .database import AsyncSessionLocal, get_engine
+from .invalidation import bus
+from . import models
+
+class FriendGraph:
+    """Friendships as sets of small integer ids, for friend-of-friend queries.
+
+    Loaded from the friendships table on first use and again after missed
+    invalidations; accepts and unfriends update it in place on every worker.
+    """
+
+    def __init__(self):
+        self._index: dict = {}
+        self._keys: list = []
+        self._adjacency: list[set[int]] = []
+        self.loaded = False
+        self._lock = asyncio.Lock()
+        self._pending: list | None = None
+
+    def _id(self, key) -> int:
+        node = self._index.get(key)
+        if node is None:
+            node = self._index[key] = len(self._keys)
+            self._keys.append(key)
+            self._adjacency.append(set())
+        return node
+
+    def _link(self, a, b, linked: bool):
+        if self._pending is not None:
+            self._pending.append((a, b, linked))
+        if linked:
+            x, y = self._id(a), self._id(b)
+            self._adjacency[x].add(y)
+            self._adjacency[y].add(x)
+        elif a in self._index and b in self._index:
+            x, y = self._index[a], self._index[b]
+            self._adjacency[x].discard(y)
+            self._adjacency[y].discard(x)
+
+    def load(self, pairs):
+        """Replace the graph with the given (user, friend) pairs"""
+        self._index, self._keys, self._adjacency = {}, [], []
+        for a, b in pairs:
+            self._link(a, b, True)
+        self.loaded = True
+
+    def apply(self, a, b, linked: bool):
+        """Apply one change here only; nothing to do until the graph is loaded"""
+        if self.loaded or self._pending is not None:
+            self._link(a, b, linked)
+
+    async def ensure_loaded(self):
+        """Load the graph from Postgres unless it already is"""
+        if self.loaded:
+            return
+        async with self._lock:
+            if self.loaded:
+                return
+            self._pending = []
+            try:
+                pairs = []
+                async with AsyncSessionLocal(bind=get_engine()) as db:
+                    result = await db.stream(select(
+                        models.Friendship.user_id, models.Friendship.friend_id
+                    ).execution_options(yield_per=10_000))
+                    async for partition in result.partitions():
+                        pairs.extend(partition)
+                pending = self._pending
+                self._pending = None
+                self.load(pairs)
+                # Edges are sets, so replaying changes the snapshot already has is harmless
+                for a, b, linked in pending:
+                    self._link(a, b, linked)
+            finally:
+                self._pending = None
+
+    def invalidate(self):
+        """Drop the graph; the next request reloads it"""
+        self.loaded = False
+
+    def friends(self, key) -> set:
+        node = self._index.get(key)
+        if node is None:
+            return set()
+        return {self._keys[friend] for friend in self._adjacency[node]}
+
+    def suggestions(self, key, limit: int, exclude=()) -> list[tuple[object, int]]:
+        """Non-friends ranked by mutual friends, as (user, mutual count)"""
+        node = self._index.get(key)
+        if node is None:
+            return []
+        friends = self._adjacency[node]
+        mutual = Counter()
+        for friend in friends:
+            mutual.update(self._adjacency[friend])
+        skip = friends | {node} | {self._index[k] for k in exclude if k in self._index}
+        best = heapq.nsmallest(
+            limit,
+            ((-count, candidate) for candidate, count in mutual.items() if candidate not in skip)
+        )
+        return [(self._keys[candidate], -count) for count, candidate in best]
+
+    def befriend(self, user_id, friend_id):
+        bus.publish("f+", user_id, friend_id, fixed=2)
+
+    def unfriend(self, user_id, friend_id):
+        bus.publish("f-", user_id, friend_id, fixed=2)
+
+friend_graph = FriendGraph()
+
+@bus.handler("f+")
+def _link_friends(user_id: str, friend_id: str):
+    friend_graph.apply(UUID(user_id), UUID(friend_id), True)
+
+@bus.handler("f-")
+def _unlink_friends(user_id: str, friend_id: str):
+    friend_graph.apply(UUID(user_id), UUID(friend_id), False)
+
+bus.on_flush(friend_graph.invalidate)
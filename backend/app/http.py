@@ -0,0 +1,30 @@
+import httpx
+
+# One pooled client for the process lifetime, opened and closed by the app lifespan
+_client: httpx.AsyncClient | None = None
+
+def create_http_client() -> httpx.AsyncClient:
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,  # connection failures only; requests are never replayed
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60),
+    )
+    return httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(5.0, connect=3.0))
+
+async def start_http_client():
+    global _client
+    if _client is None:
+        _client = create_http_client()
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    # Lazily created so scripts that never run the lifespan still work
+    global _client
+    if _client is None:
+        _client = create_http_client()
+    return _client
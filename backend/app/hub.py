@@ -0,0 +1,52 @@
+import asyncio
+from collections import defaultdict
+from uuid import UUID
+
+class Subscription:
+    """One connected client; events are queued until the stream sends them"""
+
+    def __init__(self, user_id: UUID, maxsize: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def push(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow consumer: drop what it hasn't read and tell it to refetch
+            # instead of letting the queue (or the publisher) grow unbounded
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync"})
+
+class ActivityHub:
+    """In-process pub/sub of friend activity, keyed by receiving user"""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: dict[UUID, set[Subscription]] = defaultdict(set)
+
+    def subscribe(self, user_id: UUID) -> Subscription:
+        subscription = Subscription(user_id, self.queue_size)
+        self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.user_id]
+
+    def publish(self, user_ids, event: dict):
+        for user_id in user_ids:
+            for subscription in self._subscribers.get(user_id, ()):
+                subscription.push(event)
+
+    def resync_all(self):
+        """Tell every connected client to refetch, e.g. after missed events"""
+        for subscriptions in self._subscribers.values():
+            for subscription in subscriptions:
+                subscription.push({"type": "resync"})
+
+hub = ActivityHub()
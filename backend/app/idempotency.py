@@ -0,0 +1,182 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from .auth import get_current_user
+from .cache import TTLCache
+from .config import settings
+from .database import AsyncSessionLocal, get_engine
+from . import models
+import hashlib
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+# A claim left behind by a crashed worker stops blocking retries after this
+STALE_CLAIM_SECONDS = 60
+
+@dataclass
+class StoredResponse:
+    fingerprint: str
+    status_code: int | None = None  # None while the first request is still running
+    body: bytes = b""
+    media_type: str | None = None
+
+# Finished responses by scoped key, in front of either store
+idempotency_cache = TTLCache(lambda: settings.idempotency_cache_size, lambda: settings.idempotency_ttl)
+
+class MemoryIdempotencyStore:
+    """Keys are only seen by the worker that received them"""
+
+    async def claim(self, key: str, fingerprint: str) -> StoredResponse | None:
+        """Take `key` for a new request, or return what already holds it"""
+        stored = idempotency_cache.get(key)
+        if stored is not None:
+            return stored
+        idempotency_cache.set(key, StoredResponse(fingerprint))
+        return None
+
+    async def complete(self, key: str, stored: StoredResponse):
+        idempotency_cache.set(key, stored)
+
+    async def release(self, key: str):
+        idempotency_cache.pop(key)
+
+class PostgresIdempotencyStore(MemoryIdempotencyStore):
+    """Keys shared by all workers through the idempotency_keys table"""
+
+    async def claim(self, key: str, fingerprint: str) -> StoredResponse | None:
+        stored = idempotency_cache.get(key)
+        if stored is not None and stored.status_code is not None:
+            return stored
+
+        now = datetime.utcnow()
+        row = models.IdempotencyKey
+        stmt = insert(row).values(key=key, fingerprint=fingerprint, created_at=now)
+        # Expired keys and abandoned claims are taken over in the same statement
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["key"],
+            set_={"fingerprint": fingerprint, "status_code": None, "body": None, "media_type": None, "created_at": now},
+            where=or_(
+                row.created_at < now - timedelta(seconds=settings.idempotency_ttl),
+                and_(row.status_code.is_(None), row.created_at < now - timedelta(seconds=STALE_CLAIM_SECONDS))
+            )
+        ).returning(row.key)
+        async with AsyncSessionLocal(bind=get_engine()) as db:
+            claimed = (await db.execute(stmt)).first()
+            await db.commit()
+            if claimed is not None:
+                return None
+            existing = (await db.execute(select(row).filter(row.key == key))).scalars().first()
+
+        if existing is None:
+            # Released between the two statements: the other request failed
+            return StoredResponse(fingerprint)
+        stored = StoredResponse(existing.fingerprint, existing.status_code, existing.body or b"", existing.media_type)
+        if stored.status_code is not None:
+            idempotency_cache.set(key, stored)
+        return stored
+
+    async def complete(self, key: str, stored: StoredResponse):
+        async with AsyncSessionLocal(bind=get_engine()) as db:
+            await db.execute(update(models.IdempotencyKey).where(models.IdempotencyKey.key == key).values(
+                status_code=stored.status_code, body=stored.body, media_type=stored.media_type
+            ))
+            await db.commit()
+        idempotency_cache.set(key, stored)
+
+    async def release(self, key: str):
+        async with AsyncSessionLocal(bind=get_engine()) as db:
+            await db.execute(delete(models.IdempotencyKey).where(
+                models.IdempotencyKey.key == key,
+                models.IdempotencyKey.status_code.is_(None)
+            ))
+            await db.commit()
+
+_store: MemoryIdempotencyStore | None = None
+
+def get_idempotency_store() -> MemoryIdempotencyStore:
+    global _store
+    if _store is None:
+        _store = PostgresIdempotencyStore() if settings.idempotency_store == "postgres" else MemoryIdempotencyStore()
+    return _store
+
+class IdempotentReplay(Exception):
+    def __init__(self, stored: StoredResponse):
+        self.stored = stored
+
+def idempotent_replay_handler(request: Request, exc: IdempotentReplay) -> Response:
+    stored = exc.stored
+    return Response(stored.body, status_code=stored.status_code, media_type=stored.media_type,
+                    headers={REPLAYED_HEADER: "true"})
+
+async def idempotency_key(
+    request: Request,
+    current_user: models.User = Depends(get_current_user)
+):
+    """Replay the first response to a repeated Idempotency-Key without running the endpoint.
+
+    Keys are scoped to the user and the route. A new key is claimed here and
+    IdempotencyMiddleware stores the response once it has been sent.
+    """
+    key = request.headers.get(HEADER)
+    if key is None:
+        return
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key header")
+
+    scoped = hashlib.sha256(f"{current_user.id}|{request.method} {request.url.path}|{key}".encode()).hexdigest()
+    fingerprint = hashlib.blake2b(await request.body(), digest_size=16).hexdigest()
+    stored = await get_idempotency_store().claim(scoped, fingerprint)
+    if stored is None:
+        request.state.idempotency = (scoped, fingerprint)
+        return
+    if stored.fingerprint != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    if stored.status_code is None:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    raise IdempotentReplay(stored)
+
+class IdempotencyMiddleware:
+    """Records responses to requests that claimed an Idempotency-Key.
+
+    Server errors release the key so a retry runs the endpoint again.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        # Shared with request.state of the endpoint
+        state = scope.setdefault("state", {})
+        status = None
+        media_type = None
+        chunks = []
+
+        async def send_wrapper(message):
+            nonlocal status, media_type
+            if "idempotency" in state:
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    headers = dict(message.get("headers", []))
+                    if b"content-type" in headers:
+                        media_type = headers[b"content-type"].decode("latin-1")
+                elif message["type"] == "http.response.body":
+                    chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            claimed = state.get("idempotency")
+            if claimed is not None:
+                key, fingerprint = claimed
+                store = get_idempotency_store()
+                if status is not None and status < 500:
+                    await store.complete(key, StoredResponse(fingerprint, status, b"".join(chunks), media_type))
+                else:
+                    await store.release(key)
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import uuid
+import asyncpg
+from sqlalchemy.engine import make_url
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY payloads must stay under 8000 bytes
+MAX_PAYLOAD = 7900
+MAX_PENDING = 10_000
+KEEPALIVE_SECONDS = 30
+RECONNECT_SECONDS = 2
+
+FLUSH = "*"
+
+class InvalidationBus:
+    """Cross-worker cache invalidation over Postgres LISTEN/NOTIFY.
+
+    Modules register a handler per key kind. `publish(kind, *args)` runs the
+    handler here and queues compact "kind:arg,arg" keys that one dedicated
+    connection NOTIFYs to the other workers, which run the same handler.
+    Whenever the LISTEN connection is (re)established, notifications may
+    have been missed, so every registered flush callback runs instead.
+    """
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex[:8]
+        self.handlers: dict = {}
+        self.flush_callbacks = []
+        self.running = False
+        self._pending: list[str] = []
+        self._wakeup = asyncio.Event()
+
+    def handler(self, kind: str):
+        def register(fn):
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    def on_flush(self, fn):
+        self.flush_callbacks.append(fn)
+        return fn
+
+    def publish(self, kind: str, *args, fixed: int = 0):
+        """Run the `kind` handler here and on every other worker.
+
+        Keys longer than one NOTIFY are split: the first `fixed` args lead
+        every key and the rest are spread across as many keys as needed, so
+        they must be independent of each other.
+        """
+        if not args:
+            return
+        args = [arg.hex if isinstance(arg, uuid.UUID) else str(arg) for arg in args]
+        self.handlers[kind](*args)
+        if not self.running:
+            return
+        keys = self._keys(kind, args[:fixed], args[fixed:])
+        if len(self._pending) + len(keys) > MAX_PENDING:
+            # Too far behind to send keys one by one: make everyone start over
+            self._pending = [FLUSH]
+        else:
+            self._pending.extend(keys)
+        self._wakeup.set()
+
+    def _keys(self, kind: str, head: list[str], rest: list[str]) -> list[str]:
+        limit = MAX_PAYLOAD - len(self.origin) - 1
+        prefix = f"{kind}:{','.join(head)}"
+        if not rest:
+            keys = [prefix]
+        else:
+            keys, key = [], None
+            for arg in rest:
+                if key is not None and len(key) + len(arg) + 1 <= limit:
+                    key += f",{arg}"
+                    continue
+                if key is not None:
+                    keys.append(key)
+                key = f"{prefix},{arg}" if head else f"{prefix}{arg}"
+            keys.append(key)
+        # A single argument too long for any NOTIFY: only a flush can carry it
+        return [key if len(key) <= limit else FLUSH for key in keys]
+
+    def flush(self):
+        logger.info("Flushing local caches")
+        for fn in self.flush_callbacks:
+            fn()
+
+    def _on_notification(self, connection, pid, channel, payload: str):
+        origin, _, keys = payload.partition("|")
+        if origin == self.origin:
+            return
+        for key in keys.split(";"):
+            if key == FLUSH:
+                self.flush()
+                continue
+            kind, _, args = key.partition(":")
+            handler = self.handlers.get(kind)
+            if handler is None:
+                continue
+            try:
+                handler(*args.split(","))
+            except Exception:
+                logger.exception("Bad invalidation key %r", key)
+
+    def _next_payload(self) -> tuple[str, int]:
+        """As many pending keys as fit in one NOTIFY, and how many were taken"""
+        first = self._pending[0]
+        if len(self.origin) + 1 + len(first) > MAX_PAYLOAD:
+            first = FLUSH
+        payload = f"{self.origin}|{first}"
+        taken = 1
+        for key in self._pending[1:]:
+            if len(payload) + len(key) + 1 > MAX_PAYLOAD:
+                break
+            payload += f";{key}"
+            taken += 1
+        return payload, taken
+
+    async def _send(self, connection: asyncpg.Connection, lost: asyncio.Event):
+        while not lost.is_set():
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                # A half-open LISTEN connection would otherwise go unnoticed
+                await asyncio.wait_for(connection.execute("SELECT 1"), 5)
+                continue
+            self._wakeup.clear()
+            while self._pending and not lost.is_set():
+                payload, taken = self._next_payload()
+                await connection.execute("SELECT pg_notify($1, $2)", settings.invalidation_channel, payload)
+                del self._pending[:taken]
+
+    async def run(self):
+        """Listen and send until cancelled, reconnecting as needed"""
+        dsn = make_url(settings.database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.running = True
+        try:
+            while True:
+                connection = None
+                try:
+                    connection = await asyncpg.connect(dsn)
+                    lost = asyncio.Event()
+
+                    def on_lost(_):
+                        lost.set()
+                        self._wakeup.set()
+
+                    connection.add_termination_listener(on_lost)
+                    await connection.add_listener(settings.invalidation_channel, self._on_notification)
+                    self.flush()
+                    await self._send(connection, lost)
+                    logger.warning("Invalidation connection lost")
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.exception("Invalidation connection failed")
+                finally:
+                    if connection is not None:
+                        connection.terminate()
+                await asyncio.sleep(RECONNECT_SECONDS)
+        finally:
+            self.running = False
+
+bus = InvalidationBus()
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from uuid import UUID
+from sqlalchemy import select, text
+from .database import AsyncSessionLocal, get_engine
+from .invalidation import bus
+from . import models
+
+logger = logging.getLogger(__name__)
+
+class _Fenwick:
+    """Binary indexed tree of counts over integer scores 0..size-1"""
+
+    def __init__(self, size: int):
+        self.tree = [0] * (size + 1)
+
+    @property
+    def size(self) -> int:
+        return len(self.tree) - 1
+
+    def add(self, index: int, delta: int):
+        index += 1
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index: int) -> int:
+        """Sum of counts at scores 0..index"""
+        total = 0
+        index = min(index, self.size - 1) + 1
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def search(self, k: int) -> int:
+        """Smallest score whose prefix sum reaches k (k >= 1)"""
+        position = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = position + step
+            if nxt < len(self.tree) and self.tree[nxt] < k:
+                position = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return position
+
+class RankedScores:
+    """Users bucketed by score, with a Fenwick tree over bucket sizes.
+
+    Updates, rank lookups and each step of a top-N walk are O(log S) where S
+    is the highest score; users with a score of zero are not stored.
+    """
+
+    def __init__(self, size: int = 64):
+        self.scores: dict[UUID, int] = {}
+        self.buckets: dict[int, set] = defaultdict(set)
+        self.counts = _Fenwick(size)
+
+    def __len__(self):
+        return len(self.scores)
+
+    def _grow(self, score: int):
+        size = self.counts.size
+        while size <= score:
+            size *= 2
+        self.counts = _Fenwick(size)
+        for bucket_score, members in self.buckets.items():
+            self.counts.add(bucket_score, len(members))
+
+    def add(self, user_id: UUID, delta: int):
+        old = self.scores.get(user_id, 0)
+        new = max(old + delta, 0)
+        if old == new:
+            return
+        if old:
+            self.buckets[old].discard(user_id)
+            if not self.buckets[old]:
+                del self.buckets[old]
+            self.counts.add(old, -1)
+        if new:
+            if new >= self.counts.size:
+                self._grow(new)
+            self.buckets[new].add(user_id)
+            self.counts.add(new, 1)
+            self.scores[user_id] = new
+        else:
+            del self.scores[user_id]
+
+    def score(self, user_id: UUID) -> int:
+        return self.scores.get(user_id, 0)
+
+    def rank(self, user_id: UUID) -> int | None:
+        """1 + number of users with a strictly higher score; None without a score"""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return len(self.scores) - self.counts.prefix(score) + 1
+
+    def top(self, n: int) -> list[tuple[int, UUID, int]]:
+        """(rank, user_id, score) for the best `n` users, ties ordered by id"""
+        entries = []
+        remaining = len(self.scores)
+        while remaining and len(entries) < n:
+            # The remaining users all score at or below the highest non-empty bucket
+            score = self.counts.search(remaining)
+            rank = len(self.scores) - remaining + 1
+            for user_id in sorted(self.buckets[score])[:n - len(entries)]:
+                entries.append((rank, user_id, score))
+            remaining -= len(self.buckets[score])
+        return entries
+
+def in_snapshot(snapshot: str):
+    """Predicate telling whether a transaction id's writes are visible in a
+    pg_current_snapshot() value ("xmin:xmax:xip,...")"""
+    xmin, xmax, running = snapshot.split(":")
+    xmin, xmax = int(xmin), int(xmax)
+    running = {int(xid) for xid in running.split(",") if xid}
+    return lambda xid: xid < xmin or (xid < xmax and xid not in running)
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+class Leaderboards:
+    """Pomodoro counts for the current UTC day and ISO week.
+
+    Rebuilt from daily_user_stats on startup, on day rollover and every
+    `interval` seconds; between rebuilds every logged session is applied
+    as it is committed. Each write carries its transaction id, so a rebuild
+    replays exactly the writes its snapshot did not see.
+    """
+
+    def __init__(self):
+        self.day: date | None = None
+        self.boards = {"day": RankedScores(), "week": RankedScores()}
+        self._lock = asyncio.Lock()
+        self._pending: list | None = None
+        self._rebuild_task: asyncio.Task | None = None
+
+    def _apply(self, user_id: UUID, days: dict):
+        for day, count in days.items():
+            if day == self.day:
+                self.boards["day"].add(user_id, count)
+            if week_start(self.day) <= day < week_start(self.day) + timedelta(days=7):
+                self.boards["week"].add(user_id, count)
+
+    def add(self, user_id: UUID, days: dict, xid: int):
+        """Apply {day: sessions} written by transaction `xid` for one user, here only"""
+        if self._pending is not None:
+            self._pending.append((user_id, days, xid))
+        if self.day is not None:
+            self._apply(user_id, days)
+
+    def record(self, user_id: UUID, sessions, xid: int):
+        """Count sessions committed by transaction `xid` on every worker"""
+        days = Counter(s.started_at.date() for s in sessions)
+        bus.publish("l", user_id, xid, *(f"{day.isoformat()}={count}" for day, count in days.items()), fixed=2)
+
+    def schedule_rebuild(self):
+        self._rebuild_task = asyncio.get_running_loop().create_task(self.rebuild())
+
+    async def rebuild(self):
+        async with self._lock:
+            await self._rebuild()
+
+    async def _rebuild(self):
+        today = datetime.utcnow().date()
+        start = week_start(today)
+        self._pending = []
+        try:
+            # One snapshot for both statements, so it says which writes the rows include
+            engine = get_engine().execution_options(isolation_level="REPEATABLE READ")
+            async with AsyncSessionLocal(bind=engine) as db:
+                seen = in_snapshot((await db.execute(text("SELECT pg_current_snapshot()::text"))).scalar())
+                rows = (await db.execute(select(
+                    models.DailyUserStats.user_id,
+                    models.DailyUserStats.day,
+                    models.DailyUserStats.count
+                ).filter(
+                    models.DailyUserStats.day >= start,
+                    models.DailyUserStats.day < start + timedelta(days=7)
+                ))).all()
+            daily, weekly = RankedScores(), RankedScores()
+            for user_id, day, count in rows:
+                if day == today:
+                    daily.add(user_id, count)
+                weekly.add(user_id, count)
+            self.day = today
+            self.boards = {"day": daily, "week": weekly}
+            for user_id, days, xid in self._pending:
+                if not seen(xid):
+                    self._apply(user_id, days)
+        finally:
+            self._pending = None
+
+    async def current(self, period: str) -> RankedScores:
+        """The board for `period`, rebuilt first if the UTC day has changed"""
+        if self.day != datetime.utcnow().date():
+            async with self._lock:
+                # Requests queued behind the first one find the board rebuilt
+                if self.day != datetime.utcnow().date():
+                    await self._rebuild()
+        return self.boards[period]
+
+    async def run(self, interval: float, rebuild_first: bool = True):
+        """Rebuild every `interval` seconds and right after midnight UTC.
+        
+        Without `rebuild_first` the first rebuild is left to the invalidation
+        bus, which flushes (and so rebuilds) once it is listening.
+        """
+        rebuild = rebuild_first
+        while True:
+            if rebuild:
+                try:
+                    await self.rebuild()
+                except Exception:
+                    logger.exception("Leaderboard rebuild failed")
+            rebuild = True
+            now = datetime.utcnow()
+            midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+            await asyncio.sleep(min(interval, (midnight - now).total_seconds() + 1))
+
+leaderboards = Leaderboards()
+
+@bus.handler("l")
+def _add_sessions(user_id: str, xid: str, *days: str):
+    leaderboards.add(UUID(user_id), {
+        date.fromisoformat(day): int(count)
+        for day, count in (item.split("=") for item in days)
+    }, int(xid))
+
+bus.on_flush(leaderboards.schedule_rebuild)
@@ -1,31 +1,98 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import asyncio
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from .config import settings
-from .database import engine, Base
-from .routers import auth, sessions, friends
+from .database import get_engine, get_replica_router, on_engine_created, prewarm_pool, dispose_engines
+from .auth import token_cache, user_cache, google_userinfo_cache
+from .http import start_http_client, close_http_client
+from .writebuffer import start_write_buffer, stop_write_buffer
+from .leaderboard import leaderboards
+from .invalidation import bus
+from .metrics import MetricsMiddleware, instrument_engine, register_caches
+from .slowlog import install_slow_query_log
+from .etag import NotModified, not_modified_handler
+from .idempotency import IdempotencyMiddleware, IdempotentReplay, idempotent_replay_handler, idempotency_cache
+from .routers import auth, sessions, friends, leaderboard, admin
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Importing this module must not touch the environment or the database.
+# Schema changes run separately: `python -m app.cli migrate`.
+on_engine_created(instrument_engine)
+on_engine_created(install_slow_query_log)
+register_caches(
+    auth_tokens=token_cache, auth_users=user_cache, google_userinfo=google_userinfo_cache,
+    idempotency=idempotency_cache
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_engine()
+    if settings.db_pool_prewarm > 0:
+        await prewarm_pool(settings.db_pool_prewarm)
+    await start_http_client()
+    replicas = get_replica_router()
+    health_checks = None
+    if replicas is not None:
+        health_checks = asyncio.create_task(replicas.run_health_checks(settings.replica_health_interval))
+    invalidations = None
+    if settings.invalidation_bus:
+        invalidations = asyncio.create_task(bus.run())
+    # With the bus on, its flush on connecting does the first rebuild
+    leaderboard_rebuilds = asyncio.create_task(leaderboards.run(
+        settings.leaderboard_rebuild_interval, rebuild_first=not settings.invalidation_bus
+    ))
+    if settings.session_write_buffer:
+        await start_write_buffer(
+            settings.session_flush_interval_ms / 1000,
+            settings.session_flush_max_rows,
+            settings.session_buffer_max_pending
+        )
+    yield
+    # Flush queued sessions before the pool goes away
+    await stop_write_buffer()
+    leaderboard_rebuilds.cancel()
+    if invalidations is not None:
+        invalidations.cancel()
+    if health_checks is not None:
+        health_checks.cancel()
+    await close_http_client()
+    await dispose_engines()
 
 app = FastAPI(
     title="Pomo API",
     description="FastAPI backend for Pomodoro productivity tracker",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+class SettingsCORSMiddleware(CORSMiddleware):
+    """CORS configured from settings when the middleware stack is built, not at import"""
+
+    def __init__(self, app):
+        super().__init__(
+            app,
+            allow_origins=[settings.frontend_url, "http://localhost:3000"],
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+            expose_headers=["X-Next-Cursor", "ETag", "Idempotent-Replayed"],
+        )
+
 # CORS configuration
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[settings.frontend_url, "http://localhost:3000"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+app.add_middleware(SettingsCORSMiddleware)
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+app.add_exception_handler(NotModified, not_modified_handler)
+app.add_exception_handler(IdempotentReplay, idempotent_replay_handler)
 
 # Include routers
 app.include_router(auth.router)
 app.include_router(sessions.router)
 app.include_router(friends.router)
+app.include_router(leaderboard.router)
+app.include_router(admin.router)
 
 @app.get("/")
 async def root():
@@ -34,3 +101,8 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
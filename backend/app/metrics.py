@@ -0,0 +1,158 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.routing import Match
+import time
+
+# Route template of the request being served, read by the SQL event hooks
+current_route: ContextVar[str] = ContextVar("current_route", default="background")
+
+REQUEST_LATENCY = Histogram(
+    "pomo_http_request_duration_seconds", "HTTP request latency",
+    ["method", "route", "status"]
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "pomo_http_requests_in_flight", "HTTP requests being served",
+    ["method", "route"]
+)
+SQL_LATENCY = Histogram(
+    "pomo_sql_statement_duration_seconds", "SQL statement execution time by originating route",
+    ["route"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+POOL_WAIT = Histogram(
+    "pomo_db_pool_wait_seconds", "Time spent waiting for a pooled connection",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+)
+POOL_TIMEOUTS = Counter("pomo_db_pool_timeouts_total", "Pool checkouts that timed out")
+GOOGLE_LATENCY = Histogram(
+    "pomo_google_request_duration_seconds", "Outbound Google OAuth call latency",
+    ["endpoint"]
+)
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - start)
+
+@contextmanager
+def time_google(endpoint: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        GOOGLE_LATENCY.labels(endpoint).observe(time.perf_counter() - start)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    SQL_LATENCY.labels(current_route.get()).observe(time.perf_counter() - context._metrics_start)
+
+class PoolCollector:
+    """Reads connection pool state at scrape time instead of tracking it per checkout"""
+
+    def __init__(self):
+        self.engines = []
+
+    def collect(self):
+        gauges = [
+            (GaugeMetricFamily("pomo_db_pool_size", "Configured pool size", labels=["database"]),
+             lambda pool: pool.size()),
+            (GaugeMetricFamily("pomo_db_pool_checked_out", "Connections currently checked out", labels=["database"]),
+             lambda pool: pool.checkedout()),
+            (GaugeMetricFamily("pomo_db_pool_checked_in", "Idle connections in the pool", labels=["database"]),
+             lambda pool: pool.checkedin()),
+            (GaugeMetricFamily("pomo_db_pool_overflow", "Connections open beyond pool_size", labels=["database"]),
+             lambda pool: pool.overflow()),
+        ]
+        for engine in self.engines:
+            url = engine.url
+            label = f"{url.host}:{url.port or 5432}/{url.database}"
+            for gauge, read in gauges:
+                gauge.add_metric([label], read(engine.pool))
+        for gauge, _ in gauges:
+            yield gauge
+
+pool_collector = PoolCollector()
+REGISTRY.register(pool_collector)
+
+class CacheCollector:
+    """Exposes TTLCache hit/miss counters"""
+
+    def __init__(self, caches: dict):
+        self.caches = caches
+
+    def collect(self):
+        hits = CounterMetricFamily("pomo_cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("pomo_cache_misses", "Cache misses", labels=["cache"])
+        size = GaugeMetricFamily("pomo_cache_entries", "Cached entries", labels=["cache"])
+        for name, cache in self.caches.items():
+            hits.add_metric([name], cache.hits)
+            misses.add_metric([name], cache.misses)
+            size.add_metric([name], len(cache))
+        yield hits
+        yield misses
+        yield size
+
+def instrument_engine(engine):
+    """Attach SQL timing hooks and pool gauges to an (async) engine"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    pool_collector.engines.append(engine)
+
+def register_caches(**caches):
+    REGISTRY.register(CacheCollector(caches))
+
+def _route_of(scope) -> str:
+    partial = None
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path
+    return partial or "unmatched"
+
+class MetricsMiddleware:
+    """Per-route latency and in-flight counts; plain ASGI to keep overhead low"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        route = _route_of(scope)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        token = current_route.set(route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_LATENCY.labels(method, route, str(status)).observe(time.perf_counter() - start)
+            current_route.reset(token)
+            in_flight.dec()
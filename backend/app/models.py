@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, CheckConstraint, Index, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Date, DateTime, LargeBinary, CheckConstraint, Index, ForeignKey, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
 import uuid
@@ -13,13 +14,23 @@ class User(Base):
     picture = Column(String, nullable=True)
     google_id = Column(String, unique=True, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # sessions.user_id has no foreign key, so the join is spelled out.
+    # Always load with a filtered selectinload; never iterate it lazily.
+    sessions = relationship(
+        "Session",
+        primaryjoin="User.id == foreign(Session.user_id)",
+        viewonly=True,
+        lazy="raise"
+    )
 
 class Session(Base):
     __tablename__ = "sessions"
     
-    id = Column(Integer, primary_key=True, index=True)
+    # Partitioned by month on started_at, so the key must include it
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     user_id = Column(UUID(as_uuid=True), nullable=False)
-    started_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, primary_key=True, nullable=False)
     duration_min = Column(Integer, nullable=False)
     kind = Column(String, nullable=False, default="work")
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -28,7 +39,10 @@ class Session(Base):
         CheckConstraint('duration_min BETWEEN 1 AND 180', name='check_duration'),
         CheckConstraint("kind IN ('work', 'break')", name='check_kind'),
         Index('sessions_user_started_idx', 'user_id', started_at.desc()),
+        {'postgresql_partition_by': 'RANGE (started_at)'},
     )
+    
+    user = relationship("User", primaryjoin="foreign(Session.user_id) == User.id", viewonly=True)
 
 class FriendRequest(Base):
     __tablename__ = "friend_requests"
@@ -45,6 +59,9 @@ class FriendRequest(Base):
         CheckConstraint("status IN ('pending', 'accepted', 'rejected')", name='check_status'),
         Index('friend_requests_receiver_status_idx', 'receiver_id', 'status'),
     )
+    
+    sender = relationship("User", foreign_keys=[sender_id])
+    receiver = relationship("User", foreign_keys=[receiver_id])
 
 class Friendship(Base):
     __tablename__ = "friendships"
@@ -58,3 +75,31 @@ class Friendship(Base):
         UniqueConstraint('user_id', 'friend_id', name='unique_friendship'),
         Index('friendships_user_idx', 'user_id'),
     )
+    
+    user = relationship("User", foreign_keys=[user_id])
+    friend = relationship("User", foreign_keys=[friend_id])
+
+class DailyUserStats(Base):
+    """Per-user daily rollup of sessions, maintained on write"""
+    __tablename__ = "daily_user_stats"
+    
+    user_id = Column(UUID(as_uuid=True), primary_key=True)
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total_minutes = Column(Integer, nullable=False, default=0)
+    work_count = Column(Integer, nullable=False, default=0)
+    work_minutes = Column(Integer, nullable=False, default=0)
+    break_count = Column(Integer, nullable=False, default=0)
+    break_minutes = Column(Integer, nullable=False, default=0)
+
+class IdempotencyKey(Base):
+    """Responses to replay for retried writes, when IDEMPOTENCY_STORE=postgres"""
+    __tablename__ = "idempotency_keys"
+    
+    # sha256 of user id, route and the client's Idempotency-Key
+    key = Column(String(64), primary_key=True)
+    fingerprint = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    media_type = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
@@ -0,0 +1,135 @@
+"""Monthly range partitions of the sessions table.
+
+Partitions are named sessions_YYYY_MM and cover [first of month, first of
+next month). sessions_default catches rows outside every partition; the
+next migrate or `partitions` run creates partitions for their months and
+moves them there. Old partitions can be detached and archived to gzip'd
+CSV; daily_user_stats keeps their heatmap history.
+"""
+from datetime import date, datetime
+from pathlib import Path
+from sqlalchemy import text
+import gzip
+import re
+
+PARTITION_NAME = re.compile(r"^sessions_(\d{4})_(\d{2})$")
+
+def month_start(day: date, offset: int = 0) -> date:
+    index = day.year * 12 + day.month - 1 + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"sessions_{month:%Y_%m}"
+
+def is_partitioned(connection) -> bool:
+    relkind = connection.execute(text(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass('sessions')"
+    )).scalar()
+    return relkind == "p"
+
+def list_partitions(connection) -> dict[str, date]:
+    """Monthly partitions currently attached to sessions, by name"""
+    names = connection.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass('sessions')
+    """)).scalars().all()
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[name] = date(int(match[1]), int(match[2]), 1)
+    return partitions
+
+def retained_since(connection) -> date | None:
+    """First day the sessions table still holds, or None if it holds everything.
+    
+    Earlier months were archived and only survive in daily_user_stats, so
+    rebuilding the rollup must leave them alone.
+    """
+    if not is_partitioned(connection):
+        return None
+    months = set(list_partitions(connection).values())
+    if not months:
+        return None
+    # Archiving takes the oldest months, so what is left is the unbroken run
+    # ending at the newest partition; partitions made later for backdated
+    # rows sit apart from it, with archived months in between
+    month = max(months)
+    while month_start(month, -1) in months:
+        month = month_start(month, -1)
+    return month
+
+def _default_attached(connection) -> bool:
+    return connection.execute(text("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_inherits
+            WHERE inhparent = to_regclass('sessions') AND inhrelid = to_regclass('sessions_default')
+        )
+    """)).scalar()
+
+def create_partition(connection, name: str, start: date, end: date):
+    """Attach the partition [start, end), taking its rows out of sessions_default.
+
+    Postgres refuses to create a partition while the default partition holds
+    rows in its range, so those are moved across with the default detached.
+    """
+    bounds = f"FOR VALUES FROM ('{start}') TO ('{end}')"
+    in_range = f"started_at >= '{start}' AND started_at < '{end}'"
+    stranded = _default_attached(connection) and connection.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM sessions_default WHERE {in_range})"
+    )).scalar()
+    if not stranded:
+        connection.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF sessions {bounds}"))
+        return
+    connection.execute(text("ALTER TABLE sessions DETACH PARTITION sessions_default"))
+    connection.execute(text(f"CREATE TABLE {name} PARTITION OF sessions {bounds}"))
+    connection.execute(text(f"INSERT INTO {name} SELECT * FROM sessions_default WHERE {in_range}"))
+    connection.execute(text(f"DELETE FROM sessions_default WHERE {in_range}"))
+    connection.execute(text("ALTER TABLE sessions ATTACH PARTITION sessions_default DEFAULT"))
+
+def _stranded_months(connection) -> list[date]:
+    """Months with rows in sessions_default, e.g. backdated offline uploads"""
+    if not _default_attached(connection):
+        return []
+    return connection.execute(text(
+        "SELECT DISTINCT date_trunc('month', started_at)::date FROM sessions_default"
+    )).scalars().all()
+
+def ensure_partitions(connection, months_ahead: int = 3, today: date | None = None) -> list[str]:
+    """Create this month's partition and the next `months_ahead` ones, plus
+    one for every month with rows in sessions_default, moving those rows"""
+    today = today or datetime.utcnow().date()
+    created = []
+    existing = list_partitions(connection)
+    months = {month_start(today, offset) for offset in range(months_ahead + 1)}
+    for start in sorted(months.union(_stranded_months(connection))):
+        name = partition_name(start)
+        if name in existing:
+            continue
+        create_partition(connection, name, start, month_start(start, 1))
+        created.append(name)
+    connection.execute(text("CREATE TABLE IF NOT EXISTS sessions_default PARTITION OF sessions DEFAULT"))
+    return created
+
+def archive_partitions(connection, keep_months: int, archive_dir: str | None, today: date | None = None) -> list[str]:
+    """Detach partitions older than `keep_months`; if `archive_dir` is set,
+    dump each to <archive_dir>/<name>.csv.gz and drop it"""
+    cutoff = month_start(today or datetime.utcnow().date(), -keep_months)
+    archived = []
+    for name, start in sorted(list_partitions(connection).items(), key=lambda item: item[1]):
+        if start >= cutoff:
+            continue
+        connection.execute(text(f"ALTER TABLE sessions DETACH PARTITION {name}"))
+        if archive_dir is not None:
+            path = Path(archive_dir) / f"{name}.csv.gz"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            cursor = connection.connection.cursor()
+            with gzip.open(path, "wt", newline="") as f:
+                cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+            connection.execute(text(f"DROP TABLE {name}"))
+        # One transaction per partition keeps the lock on sessions short
+        connection.commit()
+        archived.append(name)
+    return archived
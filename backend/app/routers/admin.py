@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends, HTTPException
+from ..auth import get_admin_user
+from ..slowlog import get_slow_query_log
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(get_admin_user)])
+
+def _require_slow_query_log():
+    slow_query_log = get_slow_query_log()
+    if slow_query_log is None:
+        raise HTTPException(status_code=404, detail="Slow-query log is disabled (set SLOW_QUERY_MS)")
+    return slow_query_log
+
+@router.get("/slow-queries")
+async def get_slow_queries():
+    """Most recent slow statements, newest first"""
+    return _require_slow_query_log().snapshot()
+
+@router.delete("/slow-queries")
+async def clear_slow_queries():
+    """Empty the slow-query buffer"""
+    _require_slow_query_log().clear()
+    return {"message": "Slow-query log cleared"}
@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..database import get_db
 from ..auth import verify_google_token, create_access_token, get_or_create_user
 from ..config import settings
+from ..metrics import time_google
+from ..http import get_http_client
 from .. import schemas
-import httpx
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -22,12 +23,12 @@ async def google_login():
     return RedirectResponse(google_auth_url)
 
 @router.get("/google/callback")
-async def google_callback(code: str, db: Session = Depends(get_db)):
+async def google_callback(code: str, db: AsyncSession = Depends(get_db)):
     """Handle Google OAuth callback"""
     # Exchange code for access token
-    async with httpx.AsyncClient() as client:
-        token_response = await client.post(
-            "https://oauth2.googleapis.com/token",
+    with time_google("token"):
+        token_response = await get_http_client().post(
+            settings.google_token_url,
             data={
                 "code": code,
                 "client_id": settings.google_client_id,
@@ -36,18 +37,18 @@ async def google_callback(code: str, db: Session = Depends(get_db)):
                 "grant_type": "authorization_code",
             }
         )
-        
-        if token_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to get access token")
-        
-        token_data = token_response.json()
-        google_token = token_data["access_token"]
+    
+    if token_response.status_code != 200:
+        raise HTTPException(status_code=400, detail="Failed to get access token")
+    
+    token_data = token_response.json()
+    google_token = token_data["access_token"]
     
     # Get user info from Google
     google_user = await verify_google_token(google_token)
     
     # Get or create user in our database
-    user = get_or_create_user(db, google_user)
+    user = await get_or_create_user(db, google_user)
     
     # Create JWT token with user info
     access_token = create_access_token({
@@ -63,10 +64,10 @@ async def google_callback(code: str, db: Session = Depends(get_db)):
     )
 
 @router.post("/token/verify", response_model=schemas.User)
-async def verify_token(google_token: str, db: Session = Depends(get_db)):
+async def verify_token(google_token: str, db: AsyncSession = Depends(get_db)):
     """Verify Google token and return JWT + user info"""
     google_user = await verify_google_token(google_token)
-    user = get_or_create_user(db, google_user)
+    user = await get_or_create_user(db, google_user)
     access_token = create_access_token({
         "sub": str(user.id),
         "email": user.email,
@@ -1,158 +1,190 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy import func, and_, or_, case, select, delete, update, text
 from typing import List, Optional
 from datetime import datetime, date
-from uuid import UUID
-from ..database import get_db
-from ..auth import get_current_user
+from uuid import UUID, uuid4
+import asyncio
+import json
+from ..database import get_db, note_write
+from ..auth import get_current_user, get_read_db, get_stream_user, create_stream_token, STREAM_TOKEN_EXPIRE_SECONDS
+from ..hub import hub
+from ..friend_graph import friend_graph
+from ..idempotency import idempotency_key
+from ..etag import check_etag, bump_versions
 from .. import models, schemas
 
 router = APIRouter(prefix="/friends", tags=["friends"])
 
-@router.post("/request", status_code=201)
+STREAM_HEARTBEAT_SECONDS = 15
+
+# One round trip per mutation: checks and writes run as a single statement
+# that reports which check failed, so concurrent calls cannot interleave them.
+SEND_REQUEST = text("""
+WITH receiver AS (
+    SELECT id FROM users WHERE email = :email
+),
+blocked AS (
+    SELECT CASE
+        WHEN NOT EXISTS (SELECT 1 FROM receiver) THEN 'not_found'
+        WHEN (SELECT id FROM receiver) = :sender_id THEN 'self'
+        WHEN EXISTS (
+            SELECT 1 FROM friendships
+            WHERE user_id = :sender_id AND friend_id = (SELECT id FROM receiver)
+        ) THEN 'already_friends'
+        WHEN EXISTS (
+            SELECT 1 FROM friend_requests
+            WHERE status = 'pending' AND (
+                (sender_id = :sender_id AND receiver_id = (SELECT id FROM receiver))
+                OR (sender_id = (SELECT id FROM receiver) AND receiver_id = :sender_id)
+            )
+        ) THEN 'already_requested'
+    END AS reason
+),
+sent AS (
+    INSERT INTO friend_requests (id, sender_id, receiver_id, status, created_at, updated_at)
+    SELECT CAST(:request_id AS uuid), CAST(:sender_id AS uuid), receiver.id, 'pending',
+           CAST(:now AS timestamp), CAST(:now AS timestamp)
+    FROM receiver, blocked
+    WHERE blocked.reason IS NULL
+    -- A rejected or accepted request between the same pair is reopened
+    ON CONFLICT (sender_id, receiver_id) DO UPDATE
+        SET status = 'pending', created_at = EXCLUDED.created_at, updated_at = EXCLUDED.updated_at
+        WHERE friend_requests.status <> 'pending'
+    RETURNING id
+)
+SELECT
+    coalesce(
+        (SELECT reason FROM blocked),
+        CASE WHEN EXISTS (SELECT 1 FROM sent) THEN 'sent' ELSE 'already_requested' END
+    ) AS status,
+    (SELECT id FROM sent) AS request_id,
+    (SELECT id FROM receiver) AS receiver_id
+""")
+
+ACCEPT_REQUEST = text("""
+WITH accepted AS (
+    UPDATE friend_requests
+    SET status = 'accepted', updated_at = :now
+    WHERE id = :request_id AND receiver_id = :receiver_id AND status = 'pending'
+    RETURNING sender_id, receiver_id
+),
+befriended AS (
+    INSERT INTO friendships (id, user_id, friend_id, created_at)
+    SELECT CAST(:forward_id AS uuid), sender_id, receiver_id, CAST(:now AS timestamp) FROM accepted
+    UNION ALL
+    SELECT CAST(:backward_id AS uuid), receiver_id, sender_id, CAST(:now AS timestamp) FROM accepted
+    ON CONFLICT (user_id, friend_id) DO NOTHING
+    RETURNING id
+)
+SELECT sender_id FROM accepted
+""")
+
+SEND_ERRORS = {
+    "not_found": (404, "User not found"),
+    "self": (400, "Cannot send friend request to yourself"),
+    "already_friends": (400, "Already friends"),
+    "already_requested": (400, "Friend request already exists"),
+}
+
+@router.post("/request", status_code=201, dependencies=[Depends(idempotency_key)])
 async def send_friend_request(
     request_data: schemas.FriendRequestCreate,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Send a friend request to a user by email"""
-    # Find receiver by email
-    receiver = db.query(models.User).filter(
-        models.User.email == request_data.receiver_email
-    ).first()
-    
-    if not receiver:
-        raise HTTPException(status_code=404, detail="User not found")
+    result = (await db.execute(SEND_REQUEST, {
+        "email": request_data.receiver_email,
+        "sender_id": current_user.id,
+        "request_id": uuid4(),
+        "now": datetime.utcnow()
+    })).one()
     
-    # Can't send request to yourself
-    if receiver.id == current_user.id:
-        raise HTTPException(status_code=400, detail="Cannot send friend request to yourself")
+    if result.status in SEND_ERRORS:
+        status_code, detail = SEND_ERRORS[result.status]
+        raise HTTPException(status_code=status_code, detail=detail)
     
-    # Check if already friends
-    existing_friendship = db.query(models.Friendship).filter(
-        models.Friendship.user_id == current_user.id,
-        models.Friendship.friend_id == receiver.id
-    ).first()
+    await db.commit()
+    bump_versions(current_user.id, result.receiver_id)
+    note_write(current_user.id, result.receiver_id)
     
-    if existing_friendship:
-        raise HTTPException(status_code=400, detail="Already friends")
-    
-    # Check if request already exists (in either direction)
-    existing_request = db.query(models.FriendRequest).filter(
-        or_(
-            and_(
-                models.FriendRequest.sender_id == current_user.id,
-                models.FriendRequest.receiver_id == receiver.id
-            ),
-            and_(
-                models.FriendRequest.sender_id == receiver.id,
-                models.FriendRequest.receiver_id == current_user.id
-            )
-        ),
-        models.FriendRequest.status == "pending"
-    ).first()
-    
-    if existing_request:
-        raise HTTPException(status_code=400, detail="Friend request already exists")
-    
-    # Create friend request
-    friend_request = models.FriendRequest(
-        sender_id=current_user.id,
-        receiver_id=receiver.id
-    )
-    db.add(friend_request)
-    db.commit()
-    
-    return {"message": "Friend request sent", "request_id": str(friend_request.id)}
+    return {"message": "Friend request sent", "request_id": str(result.request_id)}
 
-@router.get("/requests/incoming", response_model=List[schemas.FriendRequestResponse])
+@router.get("/requests/incoming", response_model=List[schemas.FriendRequestResponse], dependencies=[Depends(check_etag)])
 async def get_incoming_requests(
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get all incoming friend requests"""
-    requests = db.query(models.FriendRequest).filter(
+    # Sender and receiver come back in the same query
+    result = await db.execute(select(models.FriendRequest).options(
+        joinedload(models.FriendRequest.sender),
+        joinedload(models.FriendRequest.receiver)
+    ).filter(
         models.FriendRequest.receiver_id == current_user.id,
         models.FriendRequest.status == "pending"
-    ).all()
-    
-    result = []
-    for req in requests:
-        sender = db.query(models.User).filter(models.User.id == req.sender_id).first()
-        receiver = db.query(models.User).filter(models.User.id == req.receiver_id).first()
-        result.append({
-            "id": req.id,
-            "sender": sender,
-            "receiver": receiver,
-            "status": req.status,
-            "created_at": req.created_at
-        })
-    
-    return result
+    ))
+    return result.scalars().all()
 
-@router.post("/request/{request_id}/accept")
+@router.post("/request/{request_id}/accept", dependencies=[Depends(idempotency_key)])
 async def accept_friend_request(
     request_id: UUID,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Accept a friend request"""
-    friend_request = db.query(models.FriendRequest).filter(
-        models.FriendRequest.id == request_id,
-        models.FriendRequest.receiver_id == current_user.id,
-        models.FriendRequest.status == "pending"
-    ).first()
+    # Mark accepted and create both directions of the friendship at once;
+    # a concurrent accept finds the request no longer pending
+    sender_id = (await db.execute(ACCEPT_REQUEST, {
+        "request_id": request_id,
+        "receiver_id": current_user.id,
+        "forward_id": uuid4(),
+        "backward_id": uuid4(),
+        "now": datetime.utcnow()
+    })).scalar()
     
-    if not friend_request:
+    if sender_id is None:
         raise HTTPException(status_code=404, detail="Friend request not found")
     
-    # Update request status
-    friend_request.status = "accepted"
-    friend_request.updated_at = datetime.utcnow()
-    
-    # Create bidirectional friendship
-    friendship1 = models.Friendship(
-        user_id=friend_request.sender_id,
-        friend_id=friend_request.receiver_id
-    )
-    friendship2 = models.Friendship(
-        user_id=friend_request.receiver_id,
-        friend_id=friend_request.sender_id
-    )
-    
-    db.add(friendship1)
-    db.add(friendship2)
-    db.commit()
+    await db.commit()
+    bump_versions(sender_id, current_user.id)
+    note_write(sender_id, current_user.id)
+    friend_graph.befriend(sender_id, current_user.id)
     
     return {"message": "Friend request accepted"}
 
-@router.post("/request/{request_id}/reject")
+@router.post("/request/{request_id}/reject", dependencies=[Depends(idempotency_key)])
 async def reject_friend_request(
     request_id: UUID,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Reject a friend request"""
-    friend_request = db.query(models.FriendRequest).filter(
+    sender_id = (await db.execute(update(models.FriendRequest).where(
         models.FriendRequest.id == request_id,
         models.FriendRequest.receiver_id == current_user.id,
         models.FriendRequest.status == "pending"
-    ).first()
+    ).values(
+        status="rejected",
+        updated_at=datetime.utcnow()
+    ).returning(models.FriendRequest.sender_id))).scalar()
     
-    if not friend_request:
+    if sender_id is None:
         raise HTTPException(status_code=404, detail="Friend request not found")
     
-    friend_request.status = "rejected"
-    friend_request.updated_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    bump_versions(sender_id, current_user.id)
+    note_write(sender_id, current_user.id)
     
     return {"message": "Friend request rejected"}
 
-@router.get("/", response_model=List[schemas.FriendResponse])
+@router.get("/", response_model=List[schemas.FriendResponse], dependencies=[Depends(check_etag)])
 async def get_friends(
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get all friends with today's Pomodoro count"""
     # Use UTC for consistency with stored session times
@@ -161,7 +193,7 @@ async def get_friends(
     end_of_day = datetime.combine(today, datetime.max.time())
     
     # Query friends with their session counts for today
-    friends_data = db.query(
+    result = await db.execute(select(
         models.User.id,
         models.User.name,
         models.User.email,
@@ -183,7 +215,8 @@ async def get_friends(
         models.User.id, models.User.name, models.User.email, models.User.picture
     ).order_by(
         func.count(models.Session.id).desc()
-    ).all()
+    ))
+    friends_data = result.all()
     
     return [
         {
@@ -196,57 +229,219 @@ async def get_friends(
         for friend in friends_data
     ]
 
+SEARCH_LIMIT = 10
+
+def search_query(user_id, q: str, limit: int = SEARCH_LIMIT):
+    """Users whose email or name contains `q`, minus self, friends and pending requests.
+    
+    The substring match is served by the pg_trgm GIN indexes from
+    migrations/user_search_trgm.sql; prefix matches rank first.
+    """
+    already_friends = select(models.Friendship.id).filter(
+        models.Friendship.user_id == user_id,
+        models.Friendship.friend_id == models.User.id
+    ).exists()
+    already_requested = select(models.FriendRequest.id).filter(
+        models.FriendRequest.sender_id == user_id,
+        models.FriendRequest.receiver_id == models.User.id,
+        models.FriendRequest.status == "pending"
+    ).exists()
+    prefix_match = or_(
+        models.User.email.istartswith(q, autoescape=True),
+        models.User.name.istartswith(q, autoescape=True)
+    )
+    
+    return select(models.User).filter(
+        or_(
+            models.User.email.icontains(q, autoescape=True),
+            models.User.name.icontains(q, autoescape=True)
+        ),
+        models.User.id != user_id,
+        ~already_friends,
+        ~already_requested
+    ).order_by(
+        case((prefix_match, 0), else_=1),
+        func.length(models.User.email),
+        models.User.email
+    ).limit(limit)
+
+async def _activity_events(user_id):
+    subscription = hub.subscribe(user_id)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": heartbeat\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        hub.unsubscribe(subscription)
+
+@router.post("/stream/token")
+async def create_friend_stream_token(
+    current_user: models.User = Depends(get_current_user)
+):
+    """Short-lived token for opening GET /friends/stream with EventSource"""
+    return {"token": create_stream_token(current_user.id), "expires_in": STREAM_TOKEN_EXPIRE_SECONDS}
+
+@router.get("/stream")
+async def stream_friend_activity(
+    current_user: models.User = Depends(get_stream_user)
+):
+    """Server-Sent Events feed of friends' pomodoro count changes.
+    
+    Open with `new EventSource("/friends/stream?token=...")` using a token
+    from POST /friends/stream/token; the token is only checked on connect,
+    so fetch a fresh one before reconnecting. Load GET /friends/ once, then
+    apply `pomodoros_today` deltas; on a `resync` event (the client fell
+    behind) load GET /friends/ again.
+    """
+    return StreamingResponse(
+        _activity_events(current_user.id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/search")
 async def search_users(
     email: str,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Search for users by email (partial match)"""
+    """Search for users by email or name (partial match)"""
     if len(email) < 3:
         raise HTTPException(status_code=400, detail="Search query must be at least 3 characters")
     
-    # Find users matching email
-    users = db.query(models.User).filter(
-        models.User.email.ilike(f"%{email}%"),
-        models.User.id != current_user.id
-    ).limit(10).all()
+    users = (await db.execute(search_query(current_user.id, email))).scalars().all()
     
-    # Filter out already friends
-    friend_ids = db.query(models.Friendship.friend_id).filter(
-        models.Friendship.user_id == current_user.id
-    ).all()
-    friend_ids = [str(f[0]) for f in friend_ids]
-    
-    # Filter out pending requests
-    pending_ids = db.query(models.FriendRequest.receiver_id).filter(
-        models.FriendRequest.sender_id == current_user.id,
-        models.FriendRequest.status == "pending"
-    ).all()
-    pending_ids = [str(p[0]) for p in pending_ids]
-    
-    filtered_users = [
+    return [
         {
             "id": str(user.id),
             "email": user.email,
             "name": user.name,
             "picture": user.picture
         }
-        for user in users 
-        if str(user.id) not in friend_ids and str(user.id) not in pending_ids
+        for user in users
     ]
+
+# Fan-out caps for POST /friends/stats
+MAX_STATS_FRIENDS = 50
+MAX_STATS_DAYS = 366
+
+# Friendship check and per-friend dense daily series in one grouped query;
+# ids that are not friends simply produce no row
+FRIEND_STATS = text("""
+    SELECT
+        f.friend_id AS user_id,
+        array_agg(coalesce(s.count, 0) ORDER BY d.day) AS counts,
+        array_agg(coalesce(s.total_minutes, 0) ORDER BY d.day) AS total_minutes
+    FROM friendships f
+    CROSS JOIN generate_series(CAST(:start AS date), CAST(:end AS date), interval '1 day') AS d(day)
+    LEFT JOIN daily_user_stats s ON s.user_id = f.friend_id AND s.day = d.day::date
+    WHERE f.user_id = :user_id AND f.friend_id = ANY(:friend_ids)
+    GROUP BY f.friend_id
+""")
+
+@router.post("/stats", response_model=schemas.FriendStatsResponse)
+async def get_friends_stats(
+    request_data: schemas.FriendStatsRequest,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Daily session counts and minutes for several friends at once.
+    
+    Arrays have one entry per day from `start` through `end` (default today),
+    in the same layout as GET /sessions/stats/heatmap?format=dense.
+    """
+    friend_ids = list(dict.fromkeys(request_data.friend_ids))
+    end = request_data.end or datetime.utcnow().date()
+    days = (end - request_data.start).days + 1
+    
+    if not friend_ids or len(friend_ids) > MAX_STATS_FRIENDS:
+        raise HTTPException(status_code=400, detail=f"Request stats for 1 to {MAX_STATS_FRIENDS} friends")
+    if not 1 <= days <= MAX_STATS_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must cover 1 to {MAX_STATS_DAYS} days")
+    
+    rows = (await db.execute(FRIEND_STATS, {
+        "user_id": current_user.id,
+        "friend_ids": friend_ids,
+        "start": request_data.start,
+        "end": end
+    })).all()
+    
+    if len(rows) != len(friend_ids):
+        raise HTTPException(status_code=403, detail="Not friends with every requested user")
+    
+    by_id = {row.user_id: row for row in rows}
+    return {
+        "start": request_data.start,
+        "days": days,
+        "friends": [
+            {
+                "user_id": friend_id,
+                "counts": by_id[friend_id].counts,
+                "total_minutes": by_id[friend_id].total_minutes
+            }
+            for friend_id in friend_ids
+        ]
+    }
+
+SUGGESTIONS_LIMIT = 10
+
+@router.get("/suggestions")
+async def get_friend_suggestions(
+    limit: int = Query(SUGGESTIONS_LIMIT, ge=1, le=50),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Friends of friends, ranked by how many mutual friends they share with you"""
+    await friend_graph.ensure_loaded()
+    
+    # Pending requests either way are left out, as in search
+    result = await db.execute(select(
+        models.FriendRequest.sender_id, models.FriendRequest.receiver_id
+    ).filter(
+        or_(
+            models.FriendRequest.sender_id == current_user.id,
+            models.FriendRequest.receiver_id == current_user.id
+        ),
+        models.FriendRequest.status == "pending"
+    ))
+    requested = {user_id for pair in result.all() for user_id in pair}
+    
+    ranked = friend_graph.suggestions(current_user.id, limit, exclude=requested)
+    if not ranked:
+        return []
     
-    return filtered_users
+    result = await db.execute(select(models.User).filter(
+        models.User.id.in_([user_id for user_id, _ in ranked])
+    ))
+    users = {user.id: user for user in result.scalars().all()}
+    
+    return [
+        {
+            "id": str(user_id),
+            "email": users[user_id].email,
+            "name": users[user_id].name,
+            "picture": users[user_id].picture,
+            "mutual_friends": mutual
+        }
+        for user_id, mutual in ranked
+        if user_id in users
+    ]
 
 @router.delete("/{friend_id}")
 async def unfriend(
     friend_id: UUID,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Remove a friend (delete friendship)"""
     # Delete both directions of friendship
-    db.query(models.Friendship).filter(
+    await db.execute(delete(models.Friendship).where(
         or_(
             and_(
                 models.Friendship.user_id == current_user.id,
@@ -257,44 +452,44 @@ async def unfriend(
                 models.Friendship.friend_id == current_user.id
             )
         )
-    ).delete()
-    db.commit()
+    ))
+    await db.commit()
+    bump_versions(current_user.id, friend_id)
+    note_write(current_user.id, friend_id)
+    friend_graph.unfriend(current_user.id, friend_id)
     
     return {"message": "Friend removed"}
 
 @router.get("/debug/activity")
 async def debug_friend_activity(
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Debug endpoint to check friend activity data"""
-    # Get all friends
-    friends = db.query(models.User).join(
-        models.Friendship,
-        models.Friendship.friend_id == models.User.id
-    ).filter(
-        models.Friendship.user_id == current_user.id
-    ).all()
-    
     # Use UTC for consistency with stored session times
     today = datetime.utcnow().date()
     start_of_day = datetime.combine(today, datetime.min.time())
     end_of_day = datetime.combine(today, datetime.max.time())
     
-    result = []
-    for friend in friends:
-        # Get sessions for this friend today
-        sessions = db.query(models.Session).filter(
-            models.Session.user_id == friend.id,
+    # Get all friends, with today's sessions loaded in one extra query
+    friends = (await db.execute(select(models.User).join(
+        models.Friendship,
+        models.Friendship.friend_id == models.User.id
+    ).options(
+        selectinload(models.User.sessions.and_(
             models.Session.started_at >= start_of_day,
             models.Session.started_at <= end_of_day
-        ).all()
-        
-        result.append({
+        ))
+    ).filter(
+        models.Friendship.user_id == current_user.id
+    ))).scalars().all()
+    
+    return [
+        {
             "friend_id": str(friend.id),
             "friend_email": friend.email,
-            "sessions_today": len(sessions),
-            "session_times": [str(s.started_at) for s in sessions]
-        })
-    
-    return result
\ No newline at end of file
+            "sessions_today": len(friend.sessions),
+            "session_times": [str(s.started_at) for s in friend.sessions]
+        }
+        for friend in friends
+    ]
\ No newline at end of file
@@ -0,0 +1,66 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import Literal
+from ..auth import get_current_user, get_read_db
+from ..activity import get_friend_ids
+from ..leaderboard import leaderboards, week_start
+from .. import models, schemas
+
+router = APIRouter(prefix="/leaderboard", tags=["leaderboard"])
+
+@router.get("/", response_model=schemas.LeaderboardResponse)
+async def get_leaderboard(
+    period: Literal["day", "week"] = "day",
+    scope: Literal["global", "friends"] = "global",
+    limit: int = Query(10, ge=1, le=100),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Top users by pomodoros this UTC day or week, plus the caller's rank.
+    
+    Served from the in-memory boards in app/leaderboard.py; the database is
+    only asked for friend ids and the names of the users returned.
+    """
+    board = await leaderboards.current(period)
+    
+    if scope == "global":
+        top = board.top(limit)
+        my_rank = board.rank(current_user.id)
+    else:
+        # Friend circles are small: rank them directly by their board scores
+        circle = [current_user.id, *await get_friend_ids(db, current_user.id)]
+        ranked = sorted(circle, key=lambda user_id: (-board.score(user_id), user_id))
+        top, my_rank, rank = [], None, 0
+        for position, user_id in enumerate(ranked, start=1):
+            score = board.score(user_id)
+            if position == 1 or score != board.score(ranked[position - 2]):
+                rank = position
+            if user_id == current_user.id:
+                my_rank = rank
+            if position <= limit:
+                top.append((rank, user_id, score))
+    
+    result = await db.execute(select(models.User).filter(
+        models.User.id.in_([user_id for _, user_id, _ in top])
+    ))
+    users = {user.id: user for user in result.scalars().all()}
+    users[current_user.id] = current_user
+    
+    def entry(rank, user_id, score):
+        user = users.get(user_id)
+        return {
+            "rank": rank,
+            "user_id": user_id,
+            "name": user.name if user else None,
+            "picture": user.picture if user else None,
+            "pomodoros": score
+        }
+    
+    return {
+        "period": period,
+        "scope": scope,
+        "starts": leaderboards.day if period == "day" else week_start(leaderboards.day),
+        "entries": [entry(*item) for item in top],
+        "me": entry(my_rank, current_user.id, board.score(current_user.id))
+    }
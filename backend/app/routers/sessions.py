@@ -1,92 +1,281 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, or_, text
+from typing import Any, List, Literal
 from datetime import datetime, date
-from ..database import get_db
-from ..auth import get_current_user
+import array
+import base64
+import csv
+import io
+import json
+import sys
+from ..database import get_db, get_read_engine, AsyncSessionLocal
+from ..auth import get_current_user, get_read_db
+from ..idempotency import idempotency_key
+from ..etag import check_etag
+from ..stats import record_sessions, insert_sessions
+from ..activity import on_sessions_logged
+from ..config import settings
+from ..writebuffer import get_write_buffer, WriteBufferClosed
 from .. import models, schemas
 
 router = APIRouter(prefix="/sessions", tags=["sessions"])
 
-@router.post("/", response_model=schemas.SessionResponse, status_code=201)
+MAX_BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_COLUMNS = ("id", "started_at", "duration_min", "kind", "created_at")
+# Several years of daily cells for year-in-review views
+MAX_HEATMAP_DAYS = 5 * 366
+
+@router.post("/", response_model=schemas.SessionResponse, status_code=201, dependencies=[Depends(idempotency_key)])
 async def create_session(
     session_data: schemas.SessionCreate,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Log a new Pomodoro session"""
     session = models.Session(
         user_id=current_user.id,
         **session_data.model_dump()
     )
+    
+    buffer = get_write_buffer()
+    if buffer is not None:
+        wait = settings.session_write_durability != "accept"
+        # The flusher needs a pool connection of its own; holding this
+        # request's while waiting for it can exhaust the pool under load
+        await db.close()
+        try:
+            await buffer.submit(session, wait=wait)
+        except WriteBufferClosed:
+            raise HTTPException(status_code=503, detail="Server is shutting down")
+        if not wait:
+            return JSONResponse(status_code=202, content={"status": "accepted"})
+        return session
+    
     db.add(session)
-    db.commit()
-    db.refresh(session)
+    xid = await record_sessions(db, [session])
+    await db.commit()
+    await db.refresh(session)
+    await on_sessions_logged(db, current_user.id, [session], xid)
     return session
 
-@router.get("/recent", response_model=List[schemas.SessionResponse])
+@router.post("/batch", response_model=schemas.SessionBatchResponse, dependencies=[Depends(idempotency_key)])
+async def create_sessions_batch(
+    items: List[Any] = Body(...),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Log many sessions at once (offline replay); invalid items are reported, not fatal"""
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} sessions per batch")
+    
+    indexes, sessions, errors = [], [], []
+    for index, item in enumerate(items):
+        try:
+            session_data = schemas.SessionCreate.model_validate(item)
+        except ValidationError as exc:
+            errors.append({"index": index, "errors": exc.errors(include_url=False, include_context=False)})
+            continue
+        indexes.append(index)
+        sessions.append(models.Session(user_id=current_user.id, **session_data.model_dump()))
+    
+    created = []
+    if sessions:
+        xid = await insert_sessions(db, sessions)
+        await db.commit()
+        await on_sessions_logged(db, current_user.id, sessions, xid)
+        created = [{"index": index, "id": s.id} for index, s in zip(indexes, sessions)]
+    
+    return {"created": created, "errors": errors}
+
+def encode_cursor(session: models.Session) -> str:
+    raw = f"{session.started_at.isoformat()}|{session.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        started_at, session_id = raw.split("|")
+        return datetime.fromisoformat(started_at), int(session_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/recent", response_model=List[schemas.SessionResponse], dependencies=[Depends(check_etag)])
 async def get_recent_sessions(
-    limit: int = 10,
+    response: Response,
+    limit: int = Query(10, ge=1, le=100),
+    cursor: str | None = None,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get recent sessions for current user"""
-    sessions = db.query(models.Session).filter(
+    """Get recent sessions for current user, newest first.
+    
+    Pass the X-Next-Cursor header of a page as `cursor` to get the next one.
+    """
+    query = select(models.Session).filter(
         models.Session.user_id == current_user.id
-    ).order_by(
-        models.Session.started_at.desc()
-    ).limit(limit).all()
+    )
+    if cursor is not None:
+        # Keyset over (started_at, id): seeks sessions_user_started_idx
+        # instead of re-reading every newer row
+        started_at, session_id = decode_cursor(cursor)
+        query = query.filter(
+            models.Session.started_at <= started_at,
+            or_(
+                models.Session.started_at < started_at,
+                models.Session.id < session_id
+            )
+        )
+    
+    result = await db.execute(query.order_by(
+        models.Session.started_at.desc(),
+        models.Session.id.desc()
+    ).limit(limit + 1))
+    sessions = result.scalars().all()
+    
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(sessions[-1])
     return sessions
 
-@router.get("/today/total")
+async def _export_rows(engine, user_id, since: datetime | None, format: str):
+    """Yield the user's sessions as NDJSON or CSV, one cursor batch at a time"""
+    query = select(
+        *(getattr(models.Session, column) for column in EXPORT_COLUMNS)
+    ).filter(
+        models.Session.user_id == user_id
+    ).order_by(
+        models.Session.started_at
+    ).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    if since is not None:
+        query = query.filter(models.Session.started_at >= since)
+    
+    if format == "csv":
+        yield ",".join(EXPORT_COLUMNS) + "\r\n"
+    
+    # The request's get_db session is closed before the body is streamed,
+    # so the export holds its own session for the lifetime of the cursor
+    async with AsyncSessionLocal(bind=engine) as db:
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            buffer = io.StringIO()
+            if format == "csv":
+                writer = csv.writer(buffer)
+                for row in rows:
+                    writer.writerow(row)
+            else:
+                for row in rows:
+                    buffer.write(json.dumps(dict(row._mapping), default=datetime.isoformat))
+                    buffer.write("\n")
+            yield buffer.getvalue()
+
+@router.get("/export")
+async def export_sessions(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    since: datetime | None = None,
+    current_user: models.User = Depends(get_current_user)
+):
+    """Stream the user's full session history"""
+    if since is not None:
+        since = schemas.to_naive_utc(since)
+    
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _export_rows(get_read_engine(current_user.id), current_user.id, since, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="sessions.{format}"'}
+    )
+
+@router.get("/today/total", dependencies=[Depends(check_etag)])
 async def get_today_total(
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get total minutes for today"""
     # Use UTC for consistency with stored session times
     today = datetime.utcnow().date()
-    start_of_day = datetime.combine(today, datetime.min.time())
-    end_of_day = datetime.combine(today, datetime.max.time())
     
-    total = db.query(
-        func.sum(models.Session.duration_min)
+    total = await db.scalar(select(
+        models.DailyUserStats.total_minutes
     ).filter(
-        models.Session.user_id == current_user.id,
-        models.Session.started_at >= start_of_day,
-        models.Session.started_at <= end_of_day
-    ).scalar()
+        models.DailyUserStats.user_id == current_user.id,
+        models.DailyUserStats.day == today
+    ))
     
     return {"total_minutes": total or 0}
 
-@router.get("/stats/heatmap")
+# Dense heatmap: one int per day from `start` to today, zero-filled by Postgres
+DENSE_HEATMAP = text("""
+    SELECT
+        array_agg(coalesce(s.count, 0) ORDER BY d.day) AS counts,
+        array_agg(coalesce(s.total_minutes, 0) ORDER BY d.day) AS total_minutes
+    FROM generate_series(CAST(:start AS date), CAST(:end AS date), interval '1 day') AS d(day)
+    LEFT JOIN daily_user_stats s ON s.user_id = :user_id AND s.day = d.day::date
+""")
+
+def pack_int32(values: list[int]) -> str:
+    """Base64 of little-endian int32s (Int32Array in browsers)"""
+    packed = array.array("i", values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode()
+
+@router.get("/stats/heatmap", dependencies=[Depends(check_etag)])
 async def get_heatmap_data(
-    days: int = 90,
+    days: int = Query(90, ge=1, le=MAX_HEATMAP_DAYS),
+    format: Literal["sparse", "dense", "packed"] = "sparse",
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get daily session counts for heatmap"""
+    """Get daily session counts for heatmap.
+    
+    `sparse` lists days with sessions. `dense` returns `counts` and
+    `total_minutes` arrays with one entry per day from `start` through today;
+    `packed` returns the same arrays as base64 little-endian int32 buffers.
+    """
     from datetime import timedelta
     
-    start_date = datetime.utcnow() - timedelta(days=days)
+    today = datetime.utcnow().date()
+    start_date = today - timedelta(days=days)
+    
+    if format != "sparse":
+        row = (await db.execute(DENSE_HEATMAP, {
+            "start": start_date, "end": today, "user_id": current_user.id
+        })).one()
+        if format == "packed":
+            return {
+                "start": str(start_date),
+                "days": days + 1,
+                "encoding": "int32le",
+                "counts": pack_int32(row.counts),
+                "total_minutes": pack_int32(row.total_minutes)
+            }
+        return {
+            "start": str(start_date),
+            "days": days + 1,
+            "counts": row.counts,
+            "total_minutes": row.total_minutes
+        }
     
-    sessions = db.query(
-        func.date(models.Session.started_at).label('date'),
-        func.count(models.Session.id).label('count'),
-        func.sum(models.Session.duration_min).label('total_minutes')
+    result = await db.execute(select(
+        models.DailyUserStats.day,
+        models.DailyUserStats.count,
+        models.DailyUserStats.total_minutes
     ).filter(
-        models.Session.user_id == current_user.id,
-        models.Session.started_at >= start_date
-    ).group_by(
-        func.date(models.Session.started_at)
-    ).all()
+        models.DailyUserStats.user_id == current_user.id,
+        models.DailyUserStats.day >= start_date
+    ).order_by(
+        models.DailyUserStats.day
+    ))
     
     return [
         {
-            "date": str(s.date),
-            "count": s.count,
-            "total_minutes": s.total_minutes
+            "date": str(day),
+            "count": count,
+            "total_minutes": total_minutes
         }
-        for s in sessions
+        for day, count, total_minutes in result.all()
     ]
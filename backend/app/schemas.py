@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from datetime import datetime
+from pydantic import BaseModel, Field, field_validator
+from datetime import date, datetime, timedelta, timezone
 from typing import Literal
 from uuid import UUID
 
@@ -19,12 +19,32 @@ class User(UserBase):
     class Config:
         from_attributes = True
 
+def to_naive_utc(value: datetime) -> datetime:
+    """Sessions are stored as naive UTC; asyncpg rejects aware datetimes"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
 # Session schemas
+EARLIEST_SESSION = datetime(2000, 1, 1)
+# Clients' clocks run ahead; a day also covers any timezone mixup
+MAX_SESSION_CLOCK_SKEW = timedelta(days=1)
+
 class SessionCreate(BaseModel):
     started_at: datetime
     duration_min: int = Field(ge=1, le=180)
     kind: Literal["work", "break"] = "work"
 
+    @field_validator("started_at")
+    @classmethod
+    def started_at_naive_utc(cls, value: datetime) -> datetime:
+        value = to_naive_utc(value)
+        # Monthly partitions are created for any month, but a typo'd year
+        # would leave a partition (and an archive) behind for one row
+        if not EARLIEST_SESSION <= value <= datetime.utcnow() + MAX_SESSION_CLOCK_SKEW:
+            raise ValueError("started_at must be after 2000-01-01 and not in the future")
+        return value
+
 class SessionResponse(BaseModel):
     id: int
     user_id: UUID
@@ -36,6 +56,18 @@ class SessionResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class SessionBatchCreated(BaseModel):
+    index: int
+    id: int
+
+class SessionBatchError(BaseModel):
+    index: int
+    errors: list
+
+class SessionBatchResponse(BaseModel):
+    created: list[SessionBatchCreated]
+    errors: list[SessionBatchError]
+
 # Auth schemas
 class Token(BaseModel):
     access_token: str
@@ -65,3 +97,33 @@ class FriendResponse(BaseModel):
     
     class Config:
         from_attributes = True
+
+class FriendStatsRequest(BaseModel):
+    friend_ids: list[UUID]
+    start: date
+    end: date | None = None
+
+class FriendStats(BaseModel):
+    user_id: UUID
+    counts: list[int]
+    total_minutes: list[int]
+
+class FriendStatsResponse(BaseModel):
+    start: date
+    days: int
+    friends: list[FriendStats]
+
+# Leaderboard schemas
+class LeaderboardEntry(BaseModel):
+    rank: int | None
+    user_id: UUID
+    name: str | None
+    picture: str | None
+    pomodoros: int
+
+class LeaderboardResponse(BaseModel):
+    period: Literal["day", "week"]
+    scope: Literal["global", "friends"]
+    starts: date
+    entries: list[LeaderboardEntry]
+    me: LeaderboardEntry
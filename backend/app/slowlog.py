@@ -0,0 +1,123 @@
+from collections import deque
+from datetime import datetime
+from sqlalchemy import event
+from .config import settings
+from .metrics import current_route
+import json
+import logging
+import random
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r"\(\s*(?:\$\d+|%\(\w+\)s|%s|\?)(?:\s*,\s*(?:\$\d+|%\(\w+\)s|%s|\?))+\s*\)")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![$\w])\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+_WRITE = re.compile(r"\b(?:INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+
+def normalize_sql(statement: str) -> str:
+    """Collapse whitespace, literals and IN-lists so similar statements group together"""
+    statement = _STRING.sub("?", statement)
+    statement = _IN_LIST.sub("(...)", statement)
+    statement = _NUMBER.sub("?", statement)
+    return _SPACE.sub(" ", statement).strip()
+
+def is_read_only(statement: str) -> bool:
+    """Only plain reads are safe to run a second time under EXPLAIN ANALYZE"""
+    head = statement.lstrip()[:6].upper()
+    return head.startswith(("SELECT", "WITH")) and not _WRITE.search(statement)
+
+def parameters_shape(parameters, executemany: bool):
+    """Types of the bound parameters, never their values"""
+    if executemany:
+        return {"rows": len(parameters), "row": parameters_shape(parameters[0], False) if parameters else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return None
+
+class SlowQueryLog:
+    """Ring buffer of statements slower than `threshold_ms`.
+    
+    An `explain_rate` fraction of slow reads is re-run under
+    EXPLAIN (ANALYZE, BUFFERS) inside a savepoint that is always rolled
+    back, so the EXPLAIN can neither abort nor alter the request's
+    transaction. ANALYZE executes the query a second time, which is why
+    sampling is off by default.
+    """
+
+    def __init__(self, threshold_ms: float, size: int = 200, explain_rate: float = 0.0):
+        self.threshold = threshold_ms / 1000
+        self.explain_rate = explain_rate
+        self.entries: deque = deque(maxlen=size)
+
+    def install(self, engine):
+        sync_engine = getattr(engine, "sync_engine", engine)
+        event.listen(sync_engine, "before_cursor_execute", self._before)
+        event.listen(sync_engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        context._slowlog_start = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context._slowlog_start
+        if duration < self.threshold:
+            return
+        
+        entry = {
+            "sql": normalize_sql(statement),
+            "params": parameters_shape(parameters, executemany),
+            "route": current_route.get(),
+            "duration_ms": round(duration * 1000, 2),
+            "at": datetime.utcnow().isoformat(),
+            "explain": None,
+        }
+        if not executemany and is_read_only(statement) and random.random() < self.explain_rate:
+            entry["explain"] = self._explain(conn, statement, parameters)
+        self.entries.append(entry)
+
+    def _explain(self, conn, statement, parameters):
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute("SAVEPOINT slowlog_explain")
+            try:
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}", parameters)
+                plan = cursor.fetchone()[0]
+                return json.loads(plan) if isinstance(plan, str) else plan
+            except Exception as exc:
+                return {"error": str(exc)}
+            finally:
+                cursor.execute("ROLLBACK TO SAVEPOINT slowlog_explain")
+                cursor.execute("RELEASE SAVEPOINT slowlog_explain")
+        except Exception:
+            logger.exception("Could not capture EXPLAIN for slow query")
+            return None
+        finally:
+            cursor.close()
+
+    def snapshot(self) -> list:
+        return list(reversed(self.entries))
+
+    def clear(self):
+        self.entries.clear()
+
+_slow_query_log: SlowQueryLog | None = None
+
+def get_slow_query_log() -> SlowQueryLog | None:
+    """The process-wide log, or None when SLOW_QUERY_MS is 0"""
+    global _slow_query_log
+    if _slow_query_log is None and settings.slow_query_ms > 0:
+        _slow_query_log = SlowQueryLog(
+            settings.slow_query_ms,
+            size=settings.slow_query_log_size,
+            explain_rate=settings.slow_query_explain_rate
+        )
+    return _slow_query_log
+
+def install_slow_query_log(engine):
+    slow_query_log = get_slow_query_log()
+    if slow_query_log is not None:
+        slow_query_log.install(engine)
@@ -0,0 +1,101 @@
+from collections import defaultdict
+from datetime import date, datetime
+from sqlalchemy import func, literal_column, select, delete
+from sqlalchemy import insert as core_insert
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models
+
+STAT_COLUMNS = ("count", "total_minutes", "work_count", "work_minutes", "break_count", "break_minutes")
+
+def _rollup(sessions) -> dict:
+    """Sum sessions into {(user_id, day): {column: value}}"""
+    totals = defaultdict(lambda: dict.fromkeys(STAT_COLUMNS, 0))
+    for s in sessions:
+        row = totals[(s.user_id, s.started_at.date())]
+        row["count"] += 1
+        row["total_minutes"] += s.duration_min
+        row[f"{s.kind}_count"] += 1
+        row[f"{s.kind}_minutes"] += s.duration_min
+    return totals
+
+# Identifies the writing transaction, so a rollup snapshot can tell whether it saw it
+CURRENT_XID = literal_column("pg_current_xact_id()::text::bigint")
+
+async def record_sessions(db: AsyncSession, sessions) -> int | None:
+    """Add new sessions to daily_user_stats in the caller's transaction.
+    
+    Returns the transaction id, for Leaderboards to place the write against
+    its snapshot."""
+    totals = _rollup(sessions)
+    if not totals:
+        return None
+    
+    stmt = insert(models.DailyUserStats).values([
+        {"user_id": user_id, "day": day, **row}
+        for (user_id, day), row in totals.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "day"],
+        set_={
+            column: getattr(models.DailyUserStats, column) + getattr(stmt.excluded, column)
+            for column in STAT_COLUMNS
+        }
+    ).returning(CURRENT_XID)
+    return (await db.execute(stmt)).scalars().first()
+
+async def insert_sessions(db: AsyncSession, sessions) -> int | None:
+    """Insert sessions with one multi-row INSERT ... RETURNING and add them to
+    the rollup, all in the caller's transaction. Fills in id and created_at
+    and returns the transaction id, like record_sessions."""
+    for s in sessions:
+        s.created_at = s.created_at or datetime.utcnow()
+    result = await db.execute(
+        core_insert(models.Session).returning(models.Session.id, sort_by_parameter_order=True),
+        [
+            {
+                "user_id": s.user_id,
+                "started_at": s.started_at,
+                "duration_min": s.duration_min,
+                "kind": s.kind,
+                "created_at": s.created_at
+            }
+            for s in sessions
+        ]
+    )
+    for s, session_id in zip(sessions, result.scalars().all()):
+        s.id = session_id
+    return await record_sessions(db, sessions)
+
+def rebuild_daily_stats(db, user_id=None, since: date | None = None):
+    """Recompute daily_user_stats from the raw sessions table (sync session).
+    
+    With `since`, only days from then on are touched, e.g. to keep the
+    rollup of archived partitions."""
+    s = models.Session
+    work = s.kind == "work"
+    rollup = select(
+        s.user_id,
+        func.date(s.started_at),
+        func.count(s.id),
+        func.sum(s.duration_min),
+        func.count(s.id).filter(work),
+        func.coalesce(func.sum(s.duration_min).filter(work), 0),
+        func.count(s.id).filter(~work),
+        func.coalesce(func.sum(s.duration_min).filter(~work), 0),
+    ).group_by(s.user_id, func.date(s.started_at))
+    
+    clear = delete(models.DailyUserStats)
+    if since is not None:
+        rollup = rollup.filter(s.started_at >= since)
+        clear = clear.where(models.DailyUserStats.day >= since)
+    if user_id is not None:
+        rollup = rollup.filter(s.user_id == user_id)
+        clear = clear.where(models.DailyUserStats.user_id == user_id)
+    
+    db.execute(clear)
+    result = db.execute(insert(models.DailyUserStats).from_select(
+        ["user_id", "day", *STAT_COLUMNS], rollup
+    ))
+    db.commit()
+    return result.rowcount
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from .database import AsyncSessionLocal, get_engine
+from .stats import insert_sessions
+from .activity import on_sessions_logged
+from . import models
+
+logger = logging.getLogger(__name__)
+
+class WriteBufferClosed(Exception):
+    pass
+
+class SessionWriteBuffer:
+    """Group commit for session logging.
+    
+    Requests enqueue validated sessions; one background task inserts them
+    in a single multi-row statement and commit every `flush_interval`
+    seconds or `max_rows` rows, whichever comes first. The queue is bounded,
+    so when the database falls behind, submitters wait instead of piling up
+    memory.
+    """
+
+    def __init__(self, flush_interval: float, max_rows: int, max_pending: int):
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.closed = False
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, session: models.Session, wait: bool = True) -> models.Session:
+        """Queue a session; with `wait`, return once it is committed"""
+        if self.closed:
+            raise WriteBufferClosed()
+        future = asyncio.get_running_loop().create_future() if wait else None
+        await self.queue.put((session, future))
+        if future is not None:
+            await future
+        return session
+
+    async def drain(self):
+        """Stop accepting writes and flush everything already queued"""
+        self.closed = True
+        await self.queue.join()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_rows:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _insert(self, sessions) -> int | None:
+        async with AsyncSessionLocal(bind=get_engine()) as db:
+            xid = await insert_sessions(db, sessions)
+            await db.commit()
+        return xid
+
+    async def _flush(self, batch):
+        written = []  # (transaction id, batch items)
+        try:
+            written.append((await self._insert([session for session, _ in batch]), batch))
+        except Exception as exc:
+            if len(batch) == 1:
+                logger.exception("Failed to flush a buffered session")
+                self._resolve(batch, exc)
+                return
+            # One bad row must not fail every request in the batch: retry
+            # them one at a time so only the failing ones get the error
+            logger.warning("Failed to flush %d buffered sessions; retrying one at a time", len(batch), exc_info=True)
+            for item in batch:
+                try:
+                    xid = await self._insert([item[0]])
+                except Exception as item_exc:
+                    logger.exception("Failed to flush a buffered session")
+                    self._resolve([item], item_exc)
+                else:
+                    written.append((xid, [item]))
+
+        # Committed rows stay committed; a failed notification is only logged
+        by_user = defaultdict(list)
+        for xid, items in written:
+            for session, _ in items:
+                by_user[(session.user_id, xid)].append(session)
+        try:
+            async with AsyncSessionLocal(bind=get_engine()) as db:
+                for (user_id, xid), user_sessions in by_user.items():
+                    await on_sessions_logged(db, user_id, user_sessions, xid)
+        except Exception:
+            logger.exception("Failed to publish %d flushed sessions", sum(len(items) for _, items in written))
+        self._resolve([item for _, items in written for item in items])
+
+    @staticmethod
+    def _resolve(batch, exc: Exception | None = None):
+        for _, future in batch:
+            if future is not None and not future.done():
+                if exc is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(exc)
+
+_buffer: SessionWriteBuffer | None = None
+
+def get_write_buffer() -> SessionWriteBuffer | None:
+    """The running buffer, or None when sessions are written directly"""
+    return _buffer
+
+async def start_write_buffer(flush_interval: float, max_rows: int, max_pending: int):
+    global _buffer
+    _buffer = SessionWriteBuffer(flush_interval, max_rows, max_pending)
+    _buffer.start()
+
+async def stop_write_buffer():
+    global _buffer
+    if _buffer is not None:
+        await _buffer.drain()
+        _buffer = None
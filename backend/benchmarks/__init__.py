@@ -0,0 +1 @@
+# Benchmarks for the Pomo API
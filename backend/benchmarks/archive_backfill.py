@@ -0,0 +1,96 @@
+"""Archive-then-backfill check: rebuilding daily_user_stats must keep archived months.
+
+Builds a partitioned sessions table with a year of sessions in a scratch
+schema, archives all but the last --keep-months partitions, runs the same
+rebuild as `python -m app.cli backfill-stats`, and compares the rollup with
+the one from before archiving. Exits non-zero if any day was lost or
+changed. The scratch schema is dropped afterwards:
+
+    python -m benchmarks.archive_backfill --keep-months 6
+"""
+import argparse
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, text
+
+from app import models
+from app.database import get_sync_engine
+from app.partitions import archive_partitions, create_partition, ensure_partitions, month_start, partition_name, retained_since
+from app.stats import rebuild_daily_stats
+
+SESSIONS_DDL = """
+    CREATE TABLE sessions (
+        id SERIAL,
+        user_id UUID NOT NULL,
+        started_at TIMESTAMP NOT NULL,
+        duration_min INTEGER NOT NULL,
+        kind VARCHAR NOT NULL DEFAULT 'work',
+        created_at TIMESTAMP,
+        PRIMARY KEY (id, started_at)
+    ) PARTITION BY RANGE (started_at)
+"""
+
+
+def rollup(connection) -> set[tuple]:
+    return set(connection.execute(select(models.DailyUserStats.__table__)).all())
+
+
+def run(months: int, keep_months: int) -> bool:
+    schema = f"archive_check_{uuid.uuid4().hex[:8]}"
+    today = datetime.utcnow().date()
+    with get_sync_engine().connect() as connection:
+        connection.execute(text(f"CREATE SCHEMA {schema}"))
+        connection.execute(text(f"SET search_path TO {schema}"))
+        connection.commit()
+        try:
+            connection.execute(text(SESSIONS_DDL))
+            models.DailyUserStats.__table__.create(connection)
+            for offset in range(-months, 0):
+                start = month_start(today, offset)
+                create_partition(connection, partition_name(start), start, month_start(start, 1))
+            ensure_partitions(connection)
+
+            users = [uuid.uuid4() for _ in range(3)]
+            start = datetime.combine(month_start(today, -months), datetime.min.time())
+            connection.execute(models.Session.__table__.insert(), [
+                {
+                    "user_id": random.choice(users),
+                    "started_at": start + timedelta(hours=random.randrange((datetime.utcnow() - start).days * 24)),
+                    "duration_min": 25,
+                    "kind": random.choice(["work", "break"]),
+                }
+                for _ in range(2000)
+            ])
+            # rebuild_daily_stats only needs execute() and commit()
+            rebuild_daily_stats(connection)
+            before = rollup(connection)
+
+            archived = archive_partitions(connection, keep_months, archive_dir=None)
+            since = retained_since(connection)
+            rebuild_daily_stats(connection, since=since)
+            after = rollup(connection)
+        finally:
+            connection.rollback()
+            connection.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+            connection.execute(text("RESET search_path"))
+            connection.commit()
+
+    lost, changed = before - after, after - before
+    print(f"{len(before)} rollup rows, archived {len(archived)} partitions, backfilled from {since}: "
+          f"{len(lost)} rows lost or changed, {len(changed)} new")
+    return not lost and not changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--months", type=int, default=12, help="Months of sessions to generate")
+    parser.add_argument("--keep-months", type=int, default=6, help="Partitions to keep attached")
+    args = parser.parse_args()
+    sys.exit(0 if run(args.months, args.keep_months) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Batch ingest benchmark: N x POST /sessions/ versus one POST /sessions/batch.
+
+    python -m benchmarks.batch_ingest --base-url http://localhost:8000 --token $JWT --count 300
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+
+def make_sessions(count: int) -> list[dict]:
+    start = datetime.utcnow() - timedelta(days=30)
+    return [
+        {
+            "started_at": (start + timedelta(minutes=30 * i)).isoformat(),
+            "duration_min": 25,
+            "kind": "work",
+        }
+        for i in range(count)
+    ]
+
+
+async def one_by_one(client: httpx.AsyncClient, sessions: list[dict]) -> float:
+    started = time.perf_counter()
+    for session in sessions:
+        response = await client.post("/sessions/", json=session)
+        response.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def batched(client: httpx.AsyncClient, sessions: list[dict], batch_size: int) -> float:
+    started = time.perf_counter()
+    for i in range(0, len(sessions), batch_size):
+        response = await client.post("/sessions/batch", json=sessions[i:i + batch_size])
+        response.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def run(base_url: str, token: str, count: int, batch_size: int):
+    headers = {"Authorization": f"Bearer {token}"}
+    sessions = make_sessions(count)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=60) as client:
+        single = await one_by_one(client, sessions)
+        batch = await batched(client, sessions, batch_size)
+
+    print(f"one-by-one: {single:.3f}s ({count / single:.0f} sessions/s)")
+    print(f"batched:    {batch:.3f}s ({count / batch:.0f} sessions/s)")
+    print(f"speedup:    {single / batch:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", required=True, help="JWT of a throwaway benchmark user")
+    parser.add_argument("--count", type=int, default=300)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(run(args.base_url, args.token, args.count, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
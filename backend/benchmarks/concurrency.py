@@ -0,0 +1,71 @@
+"""Concurrency benchmark: hammer one endpoint with N parallel clients.
+
+Run it against a server on a local Postgres, once on the old sync build and
+once on the async build, and compare requests/second:
+
+    python -m benchmarks.concurrency --url http://localhost:8000/sessions/recent \
+        --token $JWT --concurrency 50 --duration 10
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def worker(client: httpx.AsyncClient, url: str, deadline: float, latencies: list, errors: list):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.get(url)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+        except httpx.HTTPError as exc:
+            errors.append(type(exc).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(url: str, token: str | None, concurrency: int, duration: float) -> dict:
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies: list[float] = []
+    errors: list = []
+    async with httpx.AsyncClient(headers=headers, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(
+            worker(client, url, deadline, latencies, errors) for _ in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--token", help="JWT for authenticated endpoints")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.url, args.token, args.concurrency, args.duration))
+    for key, value in result.items():
+        print(f"{key:>9}: {value:.2f}" if isinstance(value, float) else f"{key:>9}: {value}")
+
+
+if __name__ == "__main__":
+    main()
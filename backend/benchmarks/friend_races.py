@@ -0,0 +1,117 @@
+"""Friend mutation stress test: parallel duplicate sends and accepts must stay consistent.
+
+Each round creates a fresh pair of synthetic users, fires --concurrency
+identical friend requests and then --concurrency accepts of the resulting
+request at the same time, and checks that exactly one of each succeeded,
+that every other send got a 400 and every other accept a 404, and that the
+pair ended up with exactly two friendship rows.
+
+    python -m benchmarks.friend_races --base-url http://localhost:8000 --rounds 20 --concurrency 16
+
+Tokens are minted locally, so run it with the server's SECRET_KEY. Remove the
+users afterwards with `python -m benchmarks.seed --reset`.
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from collections import Counter
+
+import httpx
+from sqlalchemy import func, insert, or_, select
+
+from app import models
+from app.auth import create_access_token
+from app.database import SessionLocal, get_sync_engine
+from .seed import SYNTHETIC_PREFIX
+
+
+def create_pair() -> tuple[dict, dict]:
+    suffix = uuid.uuid4().hex[:12]
+    users = [
+        {"id": uuid.uuid4(), "email": f"{SYNTHETIC_PREFIX}race-{suffix}-{side}@bench.pomo",
+         "google_id": f"{SYNTHETIC_PREFIX}race-{suffix}-{side}"}
+        for side in ("a", "b")
+    ]
+    db = SessionLocal(bind=get_sync_engine())
+    try:
+        db.execute(insert(models.User), users)
+        db.commit()
+    finally:
+        db.close()
+    return users[0], users[1]
+
+
+def pair_state(a, b) -> tuple[int, int]:
+    """(pending requests, friendship rows) between the two users"""
+    db = SessionLocal(bind=get_sync_engine())
+    try:
+        between = lambda left, right: or_(
+            (left == a["id"]) & (right == b["id"]),
+            (left == b["id"]) & (right == a["id"])
+        )
+        pending = db.execute(select(func.count()).select_from(models.FriendRequest).filter(
+            between(models.FriendRequest.sender_id, models.FriendRequest.receiver_id),
+            models.FriendRequest.status == "pending"
+        )).scalar_one()
+        friendships = db.execute(select(func.count()).select_from(models.Friendship).filter(
+            between(models.Friendship.user_id, models.Friendship.friend_id)
+        )).scalar_one()
+    finally:
+        db.close()
+    return pending, friendships
+
+
+async def burst(client: httpx.AsyncClient, count: int, method: str, url: str, token: str, **kwargs):
+    headers = {"Authorization": f"Bearer {token}"}
+    responses = await asyncio.gather(*(
+        client.request(method, url, headers=headers, **kwargs) for _ in range(count)
+    ))
+    return responses, Counter(response.status_code for response in responses)
+
+
+async def run(base_url: str, rounds: int, concurrency: int) -> int:
+    failures = 0
+    started = time.perf_counter()
+    limits = httpx.Limits(max_connections=concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        for round_number in range(1, rounds + 1):
+            a, b = create_pair()
+            token_a = create_access_token({"sub": str(a["id"])})
+            token_b = create_access_token({"sub": str(b["id"])})
+
+            responses, sends = await burst(client, concurrency, "POST", "/friends/request", token_a,
+                                           json={"receiver_email": b["email"]})
+            pending, _ = pair_state(a, b)
+            request_ids = {r.json()["request_id"] for r in responses if r.status_code == 201}
+
+            accepts = Counter()
+            if len(request_ids) == 1:
+                _, accepts = await burst(client, concurrency, "POST",
+                                         f"/friends/request/{request_ids.pop()}/accept", token_b)
+            _, friendships = pair_state(a, b)
+
+            # Losers must be clean rejections: a 5xx means the race broke something
+            ok = (sends[201] == 1 and sends[400] == concurrency - 1 and pending == 1
+                  and accepts[200] == 1 and accepts[404] == concurrency - 1 and friendships == 2)
+            failures += not ok
+            print(f"round {round_number:>3}: sends {dict(sends)}, accepts {dict(accepts)}, "
+                  f"friendship rows {friendships} {'ok' if ok else 'INCONSISTENT'}")
+
+    print(f"{rounds - failures}/{rounds} rounds consistent in {time.perf_counter() - started:.1f}s")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    failures = asyncio.run(run(args.base_url, args.rounds, args.concurrency))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
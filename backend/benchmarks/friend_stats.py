@@ -0,0 +1,94 @@
+"""Query-count check for POST /friends/stats: statements per request must not grow with fan-out.
+
+Runs the app in-process against the seeded database and counts the SQL
+statements each request executes for 1, 10 and MAX_STATS_FRIENDS friends of
+the best-connected synthetic user, plus one request that includes a
+non-friend. Exits non-zero if any request needs more than one statement.
+
+    python -m benchmarks.seed --users 5000 --friends-per-user 5
+    python -m benchmarks.friend_stats
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Engine
+
+from app import models
+from app.auth import create_access_token
+from app.database import SessionLocal, get_sync_engine
+from app.main import app
+from app.routers.friends import MAX_STATS_FRIENDS
+from .seed import SYNTHETIC_PREFIX
+
+statements = 0
+
+
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    global statements
+    statements += 1
+
+
+def best_connected_user() -> tuple:
+    db = SessionLocal(bind=get_sync_engine())
+    try:
+        user_id = db.execute(select(models.Friendship.user_id).join(
+            models.User, models.User.id == models.Friendship.user_id
+        ).filter(
+            models.User.google_id.startswith(SYNTHETIC_PREFIX)
+        ).group_by(
+            models.Friendship.user_id
+        ).order_by(
+            func.count().desc()
+        ).limit(1)).scalar()
+        if user_id is None:
+            sys.exit("No synthetic friendships found; run `python -m benchmarks.seed` first")
+        friend_ids = db.execute(select(models.Friendship.friend_id).filter(
+            models.Friendship.user_id == user_id
+        )).scalars().all()
+    finally:
+        db.close()
+    return user_id, [str(friend_id) for friend_id in friend_ids]
+
+
+async def run(days: int) -> bool:
+    global statements
+    user_id, friend_ids = best_connected_user()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+    start = str((datetime.utcnow() - timedelta(days=days - 1)).date())
+
+    cases = [(f"{n} friends", friend_ids[:n], 200) for n in sorted({1, 10, MAX_STATS_FRIENDS}) if n <= len(friend_ids)]
+    cases.append(("with a non-friend", friend_ids[:1] + [str(uuid.uuid4())], 403))
+
+    event.listen(Engine, "before_cursor_execute", count_statement)
+    ok = True
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm the auth caches so only the endpoint's own statements are counted
+        await client.post("/friends/stats", headers=headers, json={"friend_ids": friend_ids[:1], "start": start})
+        for name, ids, expected_status in cases:
+            statements = 0
+            started = time.perf_counter()
+            response = await client.post("/friends/stats", headers=headers, json={"friend_ids": ids, "start": start})
+            elapsed = (time.perf_counter() - started) * 1000
+            passed = response.status_code == expected_status and statements == 1
+            ok &= passed
+            print(f"{name:<18} status {response.status_code}  statements {statements}  "
+                  f"{elapsed:7.1f} ms  {len(response.content):>7} bytes  {'ok' if passed else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=90)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args.days)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Group commit benchmark: concurrent POST /sessions/ and Postgres commits/second.
+
+Run once with SESSION_WRITE_BUFFER=false and once with it enabled on the
+server, and compare sessions/s against transactions committed:
+
+    python -m benchmarks.group_commit --base-url http://localhost:8000 --token $JWT \
+        --concurrency 64 --duration 10
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import text
+
+from app.database import get_sync_engine
+
+
+def committed_transactions() -> int:
+    with get_sync_engine().connect() as connection:
+        return connection.execute(text(
+            "SELECT xact_commit FROM pg_stat_database WHERE datname = current_database()"
+        )).scalar_one()
+
+
+async def worker(client: httpx.AsyncClient, deadline: float, counts: dict):
+    start = datetime.utcnow() - timedelta(days=60)
+    while time.perf_counter() < deadline:
+        session = {
+            "started_at": (start + timedelta(seconds=counts["sent"])).isoformat(),
+            "duration_min": 25,
+            "kind": "work",
+        }
+        counts["sent"] += 1
+        response = await client.post("/sessions/", json=session)
+        counts["ok" if response.status_code < 400 else "errors"] += 1
+
+
+async def run(base_url: str, token: str, concurrency: int, duration: float):
+    headers = {"Authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    counts = {"sent": 0, "ok": 0, "errors": 0}
+    before = committed_transactions()
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(worker(client, deadline, counts) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    commits = committed_transactions() - before
+
+    # xact_commit counts every transaction in the database, reads included
+    print(f"sessions:   {counts['ok']} ({counts['ok'] / elapsed:.0f}/s), errors: {counts['errors']}")
+    print(f"commits:    {commits} ({commits / elapsed:.0f}/s)")
+    print(f"per commit: {counts['ok'] / max(commits, 1):.1f} sessions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", required=True, help="JWT of a throwaway benchmark user")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    args = parser.parse_args()
+    asyncio.run(run(args.base_url, args.token, args.concurrency, args.duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Drive every API route against seeded data and record latency per route.
+
+    python -m benchmarks.seed --users 5000 --friends-per-user 5
+    python -m benchmarks.load --base-url http://localhost:8000 --concurrency 32 \
+        --duration 15 --output results/after.json
+    python -m benchmarks.load compare results/before.json results/after.json
+
+Tokens are minted locally with auth.create_access_token, so the server must
+share this process's SECRET_KEY. The Google OAuth routes are not driven.
+Requests come from synthetic users with friends, so the friends routes
+(stats, suggestions, the friends leaderboard) have real fan-out.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+import httpx
+from sqlalchemy import select
+
+from app import models
+from app.auth import create_access_token
+from app.database import SessionLocal, get_sync_engine
+from app.routers.friends import MAX_STATS_FRIENDS
+from .seed import SYNTHETIC_PREFIX
+
+
+@dataclass
+class BenchUser:
+    token: str
+    friend_ids: list[str]
+
+
+@dataclass
+class Route:
+    name: str
+    method: str
+    path: Callable[[random.Random], str]
+    body: Callable[[random.Random, BenchUser], object] | None = None
+    # Routes that take more than one request: (client, headers, user) -> final status
+    send: Callable[[httpx.AsyncClient, dict, BenchUser], Awaitable[int]] | None = None
+
+
+def _session(rng: random.Random, user: BenchUser) -> dict:
+    started = datetime.utcnow() - timedelta(minutes=rng.randint(0, 600))
+    return {"started_at": started.isoformat(), "duration_min": 25, "kind": "work"}
+
+
+def _friend_stats(rng: random.Random, user: BenchUser) -> dict:
+    start = datetime.utcnow().date() - timedelta(days=29)
+    return {"friend_ids": user.friend_ids[:MAX_STATS_FRIENDS], "start": start.isoformat()}
+
+
+async def _open_stream(client: httpx.AsyncClient, headers: dict, user: BenchUser) -> int:
+    """Token, connect and the first event (the retry hint): what a client pays per reconnect"""
+    response = await client.post("/friends/stream/token", headers=headers)
+    if response.status_code != 200:
+        return response.status_code
+    async with client.stream("GET", "/friends/stream", params={"token": response.json()["token"]}) as stream:
+        async for _ in stream.aiter_bytes():
+            break
+        return stream.status_code
+
+
+ROUTES = [
+    Route("sessions.recent", "GET", lambda rng: "/sessions/recent?limit=10"),
+    Route("sessions.today_total", "GET", lambda rng: "/sessions/today/total"),
+    Route("sessions.heatmap", "GET", lambda rng: "/sessions/stats/heatmap?days=90"),
+    Route("sessions.export", "GET", lambda rng: "/sessions/export?format=ndjson"),
+    Route("sessions.create", "POST", lambda rng: "/sessions/", _session),
+    Route("sessions.batch", "POST", lambda rng: "/sessions/batch",
+          lambda rng, user: [_session(rng, user) for _ in range(20)]),
+    Route("friends.list", "GET", lambda rng: "/friends/"),
+    Route("friends.incoming", "GET", lambda rng: "/friends/requests/incoming"),
+    Route("friends.search", "GET", lambda rng: f"/friends/search?email={SYNTHETIC_PREFIX}{rng.randint(10, 999)}"),
+    Route("friends.debug_activity", "GET", lambda rng: "/friends/debug/activity"),
+    Route("friends.stats", "POST", lambda rng: "/friends/stats", _friend_stats),
+    Route("friends.suggestions", "GET", lambda rng: "/friends/suggestions"),
+    Route("friends.stream", "GET", lambda rng: "/friends/stream", send=_open_stream),
+    Route("leaderboard.global", "GET", lambda rng: f"/leaderboard/?period={rng.choice(['day', 'week'])}"),
+    Route("leaderboard.friends", "GET", lambda rng: f"/leaderboard/?period={rng.choice(['day', 'week'])}&scope=friends"),
+    Route("health", "GET", lambda rng: "/health"),
+]
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def load_users(limit: int) -> list[BenchUser]:
+    """Synthetic users with at least one friend, and their friend ids"""
+    db = SessionLocal(bind=get_sync_engine())
+    try:
+        user_ids = db.execute(select(models.Friendship.user_id).join(
+            models.User, models.User.id == models.Friendship.user_id
+        ).filter(
+            models.User.google_id.startswith(SYNTHETIC_PREFIX)
+        ).distinct().limit(limit)).scalars().all()
+        friends = defaultdict(list)
+        for user_id, friend_id in db.execute(select(
+            models.Friendship.user_id, models.Friendship.friend_id
+        ).filter(models.Friendship.user_id.in_(user_ids))):
+            friends[user_id].append(str(friend_id))
+    finally:
+        db.close()
+    if not user_ids:
+        sys.exit("No synthetic users with friends found; run `python -m benchmarks.seed` first")
+    return [BenchUser(create_access_token({"sub": str(user_id)}), friends[user_id]) for user_id in user_ids]
+
+
+async def drive(client: httpx.AsyncClient, route: Route, users: list[BenchUser],
+                concurrency: int, duration: float, seed: int) -> dict:
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+
+    async def worker(rng: random.Random, deadline: float):
+        while time.perf_counter() < deadline:
+            user = rng.choice(users)
+            headers = {"Authorization": f"Bearer {user.token}"}
+            body = route.body(rng, user) if route.body else None
+            started = time.perf_counter()
+            try:
+                if route.send is not None:
+                    status = await route.send(client, headers, user)
+                else:
+                    response = await client.request(route.method, route.path(rng), headers=headers, json=body)
+                    status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(worker(random.Random(seed + i), deadline) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+async def run(args) -> dict:
+    users = load_users(args.users)
+    routes = [r for r in ROUTES if not args.routes or r.name in args.routes]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        for route in routes:
+            results[route.name] = await drive(client, route, users, args.concurrency, args.duration, args.seed)
+            r = results[route.name]
+            print(f"{route.name:<24} {r['rps']:>9.1f} rps  p50 {r['p50_ms']:>8.2f}  "
+                  f"p95 {r['p95_ms']:>8.2f}  p99 {r['p99_ms']:>8.2f} ms  {r['statuses']}")
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k != "func"},
+        "routes": results,
+    }
+
+
+def run_command(args):
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved {args.output}")
+
+
+def compare_command(args):
+    with open(args.before) as f:
+        before = json.load(f)["routes"]
+    with open(args.after) as f:
+        after = json.load(f)["routes"]
+    print(f"{'route':<24} {'rps':>18} {'p95 ms':>20}")
+    for name in sorted(set(before) & set(after)):
+        b, a = before[name], after[name]
+        print(f"{name:<24} {b['rps']:>8.1f} -> {a['rps']:<8.1f} {b['p95_ms']:>9.2f} -> {a['p95_ms']:<9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command")
+
+    compare = commands.add_parser("compare", help="compare two saved result files")
+    compare.add_argument("before")
+    compare.add_argument("after")
+    compare.set_defaults(func=compare_command)
+
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per route")
+    parser.add_argument("--users", type=int, default=500, help="synthetic users to mint tokens for")
+    parser.add_argument("--routes", nargs="*", help=f"subset of: {' '.join(r.name for r in ROUTES)}")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.set_defaults(func=run_command)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Google token verification benchmark against a local stub OAuth server.
+
+Starts a stub userinfo endpoint on --port and compares:
+  - a fresh httpx.AsyncClient per call (the old behaviour)
+  - the shared pooled client, distinct tokens (cache misses)
+  - the shared pooled client, repeated token (userinfo cache hits)
+
+    python -m benchmarks.login --calls 500 --port 8765
+
+Needs the usual app settings in the environment; no database is touched.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Header, HTTPException
+
+stub = FastAPI()
+
+
+@stub.get("/oauth2/v3/userinfo")
+async def userinfo(authorization: str = Header(...)):
+    token = authorization.removeprefix("Bearer ")
+    if not token.startswith("stub-"):
+        raise HTTPException(status_code=401)
+    return {"sub": token, "email": f"{token}@stub.pomo", "name": "Stub User"}
+
+
+async def timed(label: str, calls: int, fn):
+    started = time.perf_counter()
+    for i in range(calls):
+        await fn(i)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed / calls * 1000:8.3f} ms/call")
+
+
+async def run(calls: int, port: int):
+    url = f"http://127.0.0.1:{port}/oauth2/v3/userinfo"
+    os.environ["GOOGLE_USERINFO_URL"] = url
+    from app.auth import verify_google_token
+    from app.http import close_http_client, start_http_client
+
+    server = uvicorn.Server(uvicorn.Config(stub, port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    async def fresh_client(i):
+        async with httpx.AsyncClient() as client:
+            response = await client.get(url, headers={"Authorization": f"Bearer stub-fresh-{i}"})
+            response.json()
+
+    await start_http_client()
+    try:
+        await timed("fresh client per call", calls, fresh_client)
+        await timed("pooled client, cache miss", calls, lambda i: verify_google_token(f"stub-miss-{i}"))
+        await timed("pooled client, cache hit", calls, lambda i: verify_google_token("stub-hit"))
+    finally:
+        await close_http_client()
+        server.should_exit = True
+        await serving
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(run(args.calls, args.port))
+
+
+if __name__ == "__main__":
+    main()
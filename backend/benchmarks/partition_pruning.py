@@ -0,0 +1,88 @@
+"""Partition pruning check: session queries must only scan the months they ask for.
+
+EXPLAINs the started_at filters the API uses against the partitioned
+sessions table and compares the partitions in each plan with the monthly
+partitions overlapping the requested range (plus sessions_default when the
+range is not fully covered). Exits non-zero if any plan scans more:
+
+    psql "$DATABASE_URL" -f ../migrations/sessions_partitioning.sql
+    python -m benchmarks.partition_pruning
+"""
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select
+
+from app import models
+from app.database import get_sync_engine
+from app.partitions import is_partitioned, list_partitions, month_start
+
+
+def midnight(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time())
+
+
+def cases(now: datetime) -> list[tuple[str, datetime, datetime | None]]:
+    """(label, start, end) ranges on started_at; end None is open-ended"""
+    start_of_day = midnight(now.date())
+    return [
+        ("friends: today", start_of_day, start_of_day + timedelta(days=1)),
+        ("heatmap: last year", start_of_day - timedelta(days=365), start_of_day + timedelta(days=1)),
+        ("export: since 30 days", start_of_day - timedelta(days=30), None),
+    ]
+
+
+def expected_partitions(partitions: dict[str, date], start: datetime, end: datetime | None) -> set[str]:
+    scanned = {
+        name for name, month in partitions.items()
+        if midnight(month_start(month, 1)) > start and (end is None or midnight(month) < end)
+    }
+    covered = end is not None
+    month = month_start(start.date())
+    while covered and midnight(month) < end:
+        covered = month in partitions.values()
+        month = month_start(month, 1)
+    if not covered:
+        scanned.add("sessions_default")
+    return scanned
+
+
+def relations(plan: dict) -> set[str]:
+    found = {plan["Relation Name"]} if "Relation Name" in plan else set()
+    for child in plan.get("Plans", []):
+        found |= relations(child)
+    return found
+
+
+def run() -> bool:
+    ok = True
+    with get_sync_engine().connect() as connection:
+        if not is_partitioned(connection):
+            sys.exit("sessions is not partitioned; apply migrations/sessions_partitioning.sql first")
+        partitions = list_partitions(connection)
+        for label, start, end in cases(datetime.utcnow()):
+            query = select(models.Session.id).filter(models.Session.started_at >= start)
+            if end is not None:
+                query = query.filter(models.Session.started_at < end)
+            # psycopg2 inlines the parameters, so pruning happens at plan time
+            compiled = query.compile(connection)
+            plan = connection.exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {compiled.string}", compiled.params
+            ).scalar()[0]["Plan"]
+            scanned = relations(plan)
+            extra = scanned - expected_partitions(partitions, start, end)
+            ok &= not extra
+            print(f"{label:<24} scans {len(scanned):>2} partitions  "
+                  f"{'ok' if not extra else 'FAIL: ' + ', '.join(sorted(extra))}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.parse_args()
+    sys.exit(0 if run() else 1)
+
+
+if __name__ == "__main__":
+    main()
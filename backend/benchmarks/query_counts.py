@@ -0,0 +1,96 @@
+"""Query-count check for the friends endpoints: catches N+1 regressions.
+
+Runs the app in-process against the seeded database and counts the SQL
+statements each endpoint executes for the synthetic users with the most
+friends and the most incoming requests. The counts must not depend on how
+many rows come back, so any endpoint above its budget fails the run:
+
+    python -m benchmarks.seed --users 5000 --friends-per-user 5 --pending 2000
+    python -m benchmarks.query_counts
+"""
+import argparse
+import asyncio
+import sys
+
+import httpx
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Engine
+
+from app import models
+from app.auth import create_access_token
+from app.database import SessionLocal, get_sync_engine
+from app.main import app
+from .seed import SYNTHETIC_PREFIX
+
+# (user, path, statement budget); auth is served from its cache after a warm-up call
+CASES = [
+    ("hub", "/friends/", 1),
+    ("hub", "/friends/debug/activity", 2),
+    ("hub", "/friends/search?email=synthetic-1", 1),
+    ("receiver", "/friends/requests/incoming", 1),
+    ("hub", "/friends/suggestions", 2),
+    ("hub", "/leaderboard/?period=week", 1),
+    ("hub", "/leaderboard/?period=week&scope=friends", 2),
+]
+
+statements = 0
+
+
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    global statements
+    statements += 1
+
+
+def busiest_user(db, column, *filters):
+    return db.execute(select(column).join(
+        models.User, models.User.id == column
+    ).filter(
+        models.User.google_id.startswith(SYNTHETIC_PREFIX), *filters
+    ).group_by(column).order_by(func.count().desc()).limit(1)).scalar()
+
+
+def pick_users() -> dict:
+    db = SessionLocal(bind=get_sync_engine())
+    try:
+        users = {
+            "hub": busiest_user(db, models.Friendship.user_id),
+            "receiver": busiest_user(db, models.FriendRequest.receiver_id, models.FriendRequest.status == "pending"),
+        }
+    finally:
+        db.close()
+    missing = [name for name, user_id in users.items() if user_id is None]
+    if missing:
+        sys.exit(f"No synthetic {', '.join(missing)} found; run `python -m benchmarks.seed` first")
+    return users
+
+
+async def run() -> bool:
+    global statements
+    tokens = {name: create_access_token({"sub": str(user_id)}) for name, user_id in pick_users().items()}
+
+    event.listen(Engine, "before_cursor_execute", count_statement)
+    ok = True
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for user, path, budget in CASES:
+            headers = {"Authorization": f"Bearer {tokens[user]}"}
+            await client.get(path, headers=headers)
+            statements = 0
+            response = await client.get(path, headers=headers)
+            body = response.json() if response.status_code == 200 else []
+            rows = len(body["entries"] if isinstance(body, dict) else body)
+            passed = response.status_code == 200 and statements <= budget
+            ok &= passed
+            print(f"{path:<44} status {response.status_code}  rows {rows:>4}  "
+                  f"statements {statements} (budget {budget})  {'ok' if passed else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.parse_args()
+    sys.exit(0 if asyncio.run(run()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""User search benchmark on a seeded users table.
+
+Seeds synthetic users (bench-user-N@example.com) if there are fewer than
+--users, then times the /friends/search query for random substrings:
+
+    python -m benchmarks.search --users 1000000 --queries 200
+
+Run once before and once after applying migrations/user_search_trgm.sql.
+"""
+import argparse
+import random
+import statistics
+import string
+import time
+import uuid
+
+from sqlalchemy import func, select, text
+
+from app import models
+from app.database import SessionLocal, get_sync_engine
+from app.routers.friends import search_query
+
+SEED_USERS = text("""
+    INSERT INTO users (id, email, name, google_id, created_at)
+    SELECT gen_random_uuid(),
+           'bench-user-' || n || '-' || substr(md5(n::text), 1, 8) || '@example.com',
+           'Bench ' || substr(md5((n * 7)::text), 1, 10),
+           'bench-google-' || n,
+           now()
+    FROM generate_series(:start, :stop) AS n
+    ON CONFLICT DO NOTHING
+""")
+
+
+def seed(db, target: int, chunk: int = 100_000):
+    existing = db.scalar(select(func.count(models.User.id)))
+    for start in range(existing, target, chunk):
+        db.execute(SEED_USERS, {"start": start, "stop": min(start + chunk, target) - 1})
+        db.commit()
+        print(f"seeded {min(start + chunk, target)} users")
+    db.execute(text("ANALYZE users"))
+    db.commit()
+
+
+def random_query() -> str:
+    return "".join(random.choices(string.hexdigits.lower()[:16], k=random.randint(3, 5)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    db = SessionLocal(bind=get_sync_engine())
+    try:
+        seed(db, args.users)
+        searcher = uuid.uuid4()
+        timings = []
+        for _ in range(args.queries):
+            started = time.perf_counter()
+            db.execute(search_query(searcher, random_query())).all()
+            timings.append((time.perf_counter() - started) * 1000)
+    finally:
+        db.close()
+
+    timings.sort()
+    print(f"queries: {len(timings)}")
+    print(f"mean:    {statistics.fmean(timings):.2f} ms")
+    print(f"p50:     {timings[len(timings) // 2]:.2f} ms")
+    print(f"p95:     {timings[int(len(timings) * 0.95)]:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
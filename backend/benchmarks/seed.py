@@ -0,0 +1,148 @@
+"""Seed a local Postgres with a synthetic Pomo population.
+
+    python -m benchmarks.seed --users 5000 --friends-per-user 3 --days 120
+    python -m benchmarks.seed --reset   # remove synthetic data only
+
+Synthetic users have google_id 'synthetic-N', so they can be told apart from
+real accounts and removed with --reset.
+"""
+import argparse
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, select
+
+from app import models
+from app.database import SessionLocal, get_sync_engine, Base
+from app.stats import rebuild_daily_stats
+
+SYNTHETIC_PREFIX = "synthetic-"
+CHUNK = 10_000
+
+
+def synthetic_user_ids(db) -> list:
+    return db.execute(select(models.User.id).filter(
+        models.User.google_id.startswith(SYNTHETIC_PREFIX)
+    )).scalars().all()
+
+
+def reset(db):
+    user_ids = synthetic_user_ids(db)
+    for i in range(0, len(user_ids), CHUNK):
+        chunk = user_ids[i:i + CHUNK]
+        db.execute(delete(models.Session).where(models.Session.user_id.in_(chunk)))
+        db.execute(delete(models.DailyUserStats).where(models.DailyUserStats.user_id.in_(chunk)))
+        # friendships and friend_requests cascade from users
+        db.execute(delete(models.User).where(models.User.id.in_(chunk)))
+    db.commit()
+    print(f"removed {len(user_ids)} synthetic users")
+
+
+def insert_chunked(db, model, rows: list[dict]):
+    for i in range(0, len(rows), CHUNK):
+        db.execute(insert(model), rows[i:i + CHUNK])
+    db.commit()
+
+
+def power_law_edges(n: int, m: int, rng: random.Random) -> set[tuple[int, int]]:
+    """Barabási-Albert preferential attachment: degree distribution ~ k^-3"""
+    edges: set[tuple[int, int]] = set()
+    targets = list(range(min(m, n)))
+    repeated: list[int] = []
+    for node in range(len(targets), n):
+        for target in set(targets):
+            edges.add((min(node, target), max(node, target)))
+        repeated.extend(targets)
+        repeated.extend([node] * len(targets))
+        targets = [rng.choice(repeated) for _ in range(m)]
+    return edges
+
+
+def seed(db, users: int, friends_per_user: int, days: int, pending: int, rng: random.Random):
+    now = datetime.utcnow()
+    user_rows = [
+        {
+            "id": uuid.uuid4(),
+            "email": f"{SYNTHETIC_PREFIX}{i}@bench.pomo",
+            "name": f"Synthetic User {i}",
+            "google_id": f"{SYNTHETIC_PREFIX}{i}",
+            "created_at": now,
+        }
+        for i in range(users)
+    ]
+    insert_chunked(db, models.User, user_rows)
+    ids = [row["id"] for row in user_rows]
+    print(f"users:       {len(ids)}")
+
+    edges = power_law_edges(users, friends_per_user, rng)
+    friendship_rows = []
+    for a, b in edges:
+        friendship_rows.append({"id": uuid.uuid4(), "user_id": ids[a], "friend_id": ids[b], "created_at": now})
+        friendship_rows.append({"id": uuid.uuid4(), "user_id": ids[b], "friend_id": ids[a], "created_at": now})
+    insert_chunked(db, models.Friendship, friendship_rows)
+    print(f"friendships: {len(friendship_rows)} rows ({len(edges)} pairs)")
+
+    request_rows, seen = [], set(edges)
+    while len(request_rows) < pending and users > 1:
+        a, b = rng.sample(range(users), 2)
+        if (min(a, b), max(a, b)) in seen:
+            continue
+        seen.add((min(a, b), max(a, b)))
+        request_rows.append({
+            "id": uuid.uuid4(), "sender_id": ids[a], "receiver_id": ids[b],
+            "status": "pending", "created_at": now, "updated_at": now,
+        })
+    insert_chunked(db, models.FriendRequest, request_rows)
+    print(f"requests:    {len(request_rows)} pending")
+
+    # Per-user activity is heavy-tailed too: most users log a little, a few log a lot
+    session_count = 0
+    rows = []
+    for user_id in ids:
+        daily_rate = min(rng.paretovariate(1.5) - 0.5, 16)
+        for day in range(days):
+            for _ in range(int(rng.expovariate(1 / daily_rate)) if daily_rate > 0 else 0):
+                kind = "work" if rng.random() < 0.8 else "break"
+                rows.append({
+                    "user_id": user_id,
+                    "started_at": now - timedelta(days=day, minutes=rng.randint(0, 24 * 60 - 1)),
+                    "duration_min": 25 if kind == "work" else 5,
+                    "kind": kind,
+                    "created_at": now,
+                })
+        if len(rows) >= CHUNK:
+            insert_chunked(db, models.Session, rows)
+            session_count += len(rows)
+            rows = []
+    insert_chunked(db, models.Session, rows)
+    session_count += len(rows)
+    print(f"sessions:    {session_count}")
+
+    rebuild_daily_stats(db)
+    print("daily_user_stats rebuilt")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--friends-per-user", type=int, default=3, help="edges added per new user (BA model m)")
+    parser.add_argument("--days", type=int, default=90, help="days of session history")
+    parser.add_argument("--pending", type=int, default=500, help="pending friend requests")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="delete synthetic data and exit")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=get_sync_engine())
+    db = SessionLocal(bind=get_sync_engine())
+    try:
+        if args.reset:
+            reset(db)
+        else:
+            seed(db, args.users, args.friends_per_user, args.days, args.pending, random.Random(args.seed))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
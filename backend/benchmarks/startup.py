@@ -0,0 +1,76 @@
+"""Startup benchmark: import time of app.main and time to first request.
+
+    python -m benchmarks.startup --runs 5 --output startup.json
+
+Import is timed in a fresh interpreter with no database reachable, so it
+also checks that importing the app stays free of I/O. Time to first request
+launches uvicorn and polls /health, so it needs the usual environment.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+
+def time_import() -> float:
+    # Unroutable DATABASE_URL: importing must not try to connect
+    env = {
+        "DATABASE_URL": "postgresql://nobody@192.0.2.1:5432/none",
+        "SECRET_KEY": "x", "GOOGLE_CLIENT_ID": "x", "GOOGLE_CLIENT_SECRET": "x",
+        "GOOGLE_REDIRECT_URI": "http://localhost/cb",
+        **{k: v for k, v in os.environ.items() if k == "PATH"},
+    }
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=env, capture_output=True, text=True, timeout=60)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr)
+    return float(out.stdout.strip())
+
+
+def time_first_request(port: int) -> float:
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"]
+    )
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    imports = [time_import() for _ in range(args.runs)]
+    first_requests = [time_first_request(args.port) for _ in range(args.runs)]
+    report = {
+        "import_s": {"median": statistics.median(imports), "runs": imports},
+        "first_request_s": {"median": statistics.median(first_requests), "runs": first_requests},
+    }
+    print(f"import app.main:   {report['import_s']['median'] * 1000:8.1f} ms (median of {args.runs})")
+    print(f"first /health 200: {report['first_request_s']['median'] * 1000:8.1f} ms (median of {args.runs})")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
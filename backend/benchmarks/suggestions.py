@@ -0,0 +1,112 @@
+"""Friend suggestion benchmark: in-memory adjacency index vs a friendships self-join.
+
+By default builds a Barabasi-Albert power-law graph in memory (no database):
+
+    python -m benchmarks.suggestions --users 200000 --friends-per-user 5 --queries 500
+
+With --from-db, loads the seeded friendships table instead and also times the
+equivalent SQL self-join for the same users:
+
+    python -m benchmarks.seed --users 50000 --friends-per-user 5
+    python -m benchmarks.suggestions --from-db --queries 200
+"""
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+
+from sqlalchemy import select, text
+
+from app import models
+from app.database import SessionLocal, get_sync_engine
+from app.friend_graph import FriendGraph
+from .seed import power_law_edges
+
+MUTUAL_FRIENDS_SQL = text("""
+    SELECT f2.friend_id, count(*) AS mutual
+    FROM friendships f1
+    JOIN friendships f2 ON f2.user_id = f1.friend_id
+    WHERE f1.user_id = :user_id
+      AND f2.friend_id <> :user_id
+      AND NOT EXISTS (
+          SELECT 1 FROM friendships f3 WHERE f3.user_id = :user_id AND f3.friend_id = f2.friend_id
+      )
+    GROUP BY f2.friend_id
+    ORDER BY mutual DESC, f2.friend_id
+    LIMIT :limit
+""")
+
+
+def summarize(name: str, timings: list[float]):
+    timings.sort()
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{name:<28} mean {statistics.fmean(timings) * 1000:8.3f} ms   "
+          f"p50 {timings[len(timings) // 2] * 1000:8.3f} ms   p99 {p99 * 1000:8.3f} ms")
+
+
+def load_pairs(args) -> list:
+    if not args.from_db:
+        rng = random.Random(args.seed)
+        edges = power_law_edges(args.users, args.friends_per_user, rng)
+        return [pair for a, b in edges for pair in ((a, b), (b, a))]
+    with get_sync_engine().connect() as connection:
+        return connection.execute(select(models.Friendship.user_id, models.Friendship.friend_id)).all()
+
+
+def pick_users(graph: FriendGraph, keys: list, queries: int, rng: random.Random) -> list:
+    """Half the queries for the best-connected users, half for random ones"""
+    by_degree = sorted(keys, key=lambda key: len(graph.friends(key)), reverse=True)
+    hubs = by_degree[:max(1, queries // 2)]
+    return hubs + [rng.choice(keys) for _ in range(queries - len(hubs))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--friends-per-user", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--from-db", action="store_true", help="use the friendships table")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    pairs = load_pairs(args)
+    graph = FriendGraph()
+    tracemalloc.start()
+    started = time.perf_counter()
+    graph.load(pairs)
+    build = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    keys = list({a for a, _ in pairs})
+    degrees = sorted((len(graph.friends(key)) for key in keys), reverse=True)
+    print(f"{len(keys)} users, {len(pairs) // 2} friendships, max degree {degrees[0]}, "
+          f"median degree {degrees[len(degrees) // 2]}")
+    print(f"index built in {build:.2f}s, ~{memory / 2**20:.0f} MiB")
+
+    users = pick_users(graph, keys, args.queries, rng)
+    timings = []
+    for user in users:
+        started = time.perf_counter()
+        graph.suggestions(user, args.limit)
+        timings.append(time.perf_counter() - started)
+    summarize("in-memory index", timings)
+
+    if args.from_db:
+        db = SessionLocal(bind=get_sync_engine())
+        try:
+            timings = []
+            for user in users:
+                started = time.perf_counter()
+                db.execute(MUTUAL_FRIENDS_SQL, {"user_id": user, "limit": args.limit}).all()
+                timings.append(time.perf_counter() - started)
+        finally:
+            db.close()
+        summarize("friendships self-join", timings)
+
+
+if __name__ == "__main__":
+    main()
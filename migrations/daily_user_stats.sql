@@ -0,0 +1,28 @@
+-- Daily per-user session rollup used by the heatmap and today-total endpoints
+
+CREATE TABLE IF NOT EXISTS daily_user_stats (
+    user_id UUID NOT NULL,
+    day DATE NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    total_minutes INTEGER NOT NULL DEFAULT 0,
+    work_count INTEGER NOT NULL DEFAULT 0,
+    work_minutes INTEGER NOT NULL DEFAULT 0,
+    break_count INTEGER NOT NULL DEFAULT 0,
+    break_minutes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+-- Backfill from existing sessions (same as `python -m app.cli backfill-stats`)
+INSERT INTO daily_user_stats (user_id, day, count, total_minutes, work_count, work_minutes, break_count, break_minutes)
+SELECT
+    user_id,
+    date(started_at),
+    count(*),
+    sum(duration_min),
+    count(*) FILTER (WHERE kind = 'work'),
+    coalesce(sum(duration_min) FILTER (WHERE kind = 'work'), 0),
+    count(*) FILTER (WHERE kind = 'break'),
+    coalesce(sum(duration_min) FILTER (WHERE kind = 'break'), 0)
+FROM sessions
+GROUP BY user_id, date(started_at)
+ON CONFLICT (user_id, day) DO NOTHING;
@@ -0,0 +1,13 @@
+-- Responses replayed for retried writes that carry an Idempotency-Key.
+-- Only used with IDEMPOTENCY_STORE=postgres; prune with `python -m app.cli prune-idempotency`.
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key VARCHAR(64) PRIMARY KEY,
+    fingerprint VARCHAR NOT NULL,
+    status_code INTEGER,
+    body BYTEA,
+    media_type VARCHAR,
+    created_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_idempotency_keys_created_at ON idempotency_keys (created_at);
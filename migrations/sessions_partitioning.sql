@@ -0,0 +1,58 @@
+-- Convert sessions into a table range-partitioned by month on started_at.
+-- Run during a quiet period: rows are copied inside one transaction.
+-- Afterwards keep partitions ahead of time with `python -m app.cli partitions`.
+
+BEGIN;
+
+ALTER TABLE sessions RENAME TO sessions_unpartitioned;
+ALTER INDEX sessions_pkey RENAME TO sessions_unpartitioned_pkey;
+ALTER INDEX sessions_user_started_idx RENAME TO sessions_unpartitioned_user_started_idx;
+ALTER INDEX IF EXISTS ix_sessions_id RENAME TO ix_sessions_unpartitioned_id;
+-- Keep the id sequence when the old table is dropped
+ALTER SEQUENCE sessions_id_seq OWNED BY NONE;
+
+CREATE TABLE sessions (
+    id INTEGER NOT NULL DEFAULT nextval('sessions_id_seq'),
+    user_id UUID NOT NULL,
+    started_at TIMESTAMP NOT NULL,
+    duration_min INTEGER NOT NULL,
+    kind VARCHAR NOT NULL DEFAULT 'work',
+    created_at TIMESTAMP,
+    PRIMARY KEY (id, started_at),
+    CONSTRAINT check_duration CHECK (duration_min BETWEEN 1 AND 180),
+    CONSTRAINT check_kind CHECK (kind IN ('work', 'break'))
+) PARTITION BY RANGE (started_at);
+
+ALTER SEQUENCE sessions_id_seq OWNED BY sessions.id;
+CREATE INDEX sessions_user_started_idx ON sessions (user_id, started_at DESC);
+CREATE INDEX ix_sessions_id ON sessions (id);
+
+-- One partition per month from the oldest session through three months ahead
+DO $$
+DECLARE
+    month DATE;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', coalesce((SELECT min(started_at) FROM sessions_unpartitioned), now())),
+            date_trunc('month', now()) + interval '3 months',
+            interval '1 month'
+        )::date
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF sessions FOR VALUES FROM (%L) TO (%L)',
+            'sessions_' || to_char(month, 'YYYY_MM'), month, (month + interval '1 month')::date
+        );
+    END LOOP;
+END $$;
+
+CREATE TABLE IF NOT EXISTS sessions_default PARTITION OF sessions DEFAULT;
+
+INSERT INTO sessions (id, user_id, started_at, duration_min, kind, created_at)
+SELECT id, user_id, started_at, duration_min, kind, created_at FROM sessions_unpartitioned;
+
+DROP TABLE sessions_unpartitioned;
+
+COMMIT;
+
+ANALYZE sessions;
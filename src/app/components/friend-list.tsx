@@ -88,6 +88,61 @@ export function FriendList() {
     }
   }, [user, loadFriends, loadFriendRequests])
 
+  // Live pomodoro counts: apply deltas pushed by the server instead of polling
+  useEffect(() => {
+    if (!user) return
+
+    let source: EventSource | null = null
+    let retryTimer: ReturnType<typeof setTimeout> | undefined
+    let closed = false
+
+    async function connect() {
+      try {
+        const { token } = await apiClient.getFriendStreamToken()
+        if (closed) return
+        source = new EventSource(apiClient.friendStreamUrl(token))
+      } catch (error) {
+        console.error('Failed to open friend activity stream:', error)
+        retryTimer = setTimeout(connect, 10000)
+        return
+      }
+
+      source.addEventListener('pomodoros_today', (event) => {
+        const { friend_id, delta } = JSON.parse((event as MessageEvent).data)
+        setFriends((current) =>
+          current
+            .map((friend) =>
+              friend.id === friend_id
+                ? { ...friend, pomodoros_today: friend.pomodoros_today + delta }
+                : friend
+            )
+            .sort((a, b) => b.pomodoros_today - a.pomodoros_today)
+        )
+      })
+      source.addEventListener('resync', () => {
+        loadFriends()
+      })
+      source.onerror = () => {
+        // Stream tokens expire within a minute: reconnect with a fresh one
+        // and reload, since events may have been missed in between
+        source?.close()
+        if (!closed) {
+          retryTimer = setTimeout(() => {
+            loadFriends()
+            connect()
+          }, 5000)
+        }
+      }
+    }
+
+    connect()
+    return () => {
+      closed = true
+      clearTimeout(retryTimer)
+      source?.close()
+    }
+  }, [user, loadFriends])
+
   // Debounced search
   useEffect(() => {
     const timer = setTimeout(() => {
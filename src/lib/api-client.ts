@@ -108,6 +108,18 @@ export class ApiClient {
     });
   }
 
+  // EventSource cannot send the Authorization header, so the stream is
+  // opened with a short-lived token in the query string
+  async getFriendStreamToken(): Promise<{ token: string; expires_in: number }> {
+    return this.request('/friends/stream/token', {
+      method: 'POST',
+    });
+  }
+
+  friendStreamUrl(token: string) {
+    return `${API_URL}/friends/stream?token=${encodeURIComponent(token)}`;
+  }
+
   async getIncomingRequests() {
     return this.request('/friends/requests/incoming');
   }